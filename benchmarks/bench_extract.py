@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Compare the HTML extraction backends used by icon discovery.
+#
+#   python3 benchmarks/bench_extract.py [PAGE.html | DIR ...] [--repeat N]
+#
+# With no pages given, a synthetic corpus is generated. Every backend must
+# produce the same candidates and title for every page; a mismatch is reported
+# and makes the script exit non-zero.
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import webappify  # noqa: E402
+
+BASE_URL = "https://example.com/app/"
+
+def synthetic_corpus():
+    pages = {}
+    for links, body_kb in ((4, 10), (40, 200), (200, 2000)):
+        head = ["<meta charset=utf-8><title> Synthetic &amp; Co </title>",
+                '<meta property="og:image" content="/og.png">']
+        for i in range(links):
+            rel = ("icon", "apple-touch-icon", "stylesheet", "preload")[i % 4]
+            head.append(f'<link rel="{rel}" href="/asset-{i}.png" sizes="{16 * (i % 8 + 1)}x{16 * (i % 8 + 1)}">')
+        body = "<div class=row><p>lorem ipsum dolor sit amet</p></div>\n" * (body_kb * 1024 // 55)
+        pages[f"synthetic-{links}links-{body_kb}kb"] = f"<!doctype html><html><head>{''.join(head)}</head><body>{body}</body></html>"
+    # Repeated attributes: the first one counts, whichever backend parses it
+    pages["duplicate-attributes"] = ("<!doctype html><html><head><title>Dup</title>"
+                                     "<link rel=icon href=/a.png href=/b.png sizes=32x32 SIZES=64x64>"
+                                     "<link REL=apple-touch-icon rel=stylesheet href=/touch.png>"
+                                     "<meta property=og:image content=/og-a.png content=/og-b.png></head><body></body></html>")
+    return pages
+
+def load_corpus(paths):
+    pages = {}
+    for path in map(pathlib.Path, paths):
+        files = sorted(path.glob("*.htm*")) if path.is_dir() else [path]
+        for f in files:
+            pages[f.name] = f.read_text(encoding="utf-8", errors="replace")
+    return pages
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webappify HTML extraction backends.")
+    parser.add_argument("pages", nargs="*", help="Saved HTML pages or directories of them")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per page and backend; the best is reported")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.pages) if args.pages else synthetic_corpus()
+    backends = [b for b in webappify.HEAD_EXTRACTORS
+                if not (b == "lxml" and not webappify.LXML_OK) and not (b == "soup" and not webappify.BS4_OK)]
+    columns = (["full-soup"] if webappify.BS4_OK else []) + backends
+
+    mismatches = 0
+    print(f"{'page':40} {'KiB':>7} " + " ".join(f"{c:>11}" for c in columns))
+    totals = dict.fromkeys(columns, 0.0)
+    for name, html in pages.items():
+        row = {}
+        if webappify.BS4_OK:
+            from bs4 import BeautifulSoup
+            # What discovery used to do: build the whole tree
+            row["full-soup"] = best_of(lambda: BeautifulSoup(html, "html.parser"), args.repeat)
+        results = {}
+        for backend in backends:
+            row[backend] = best_of(lambda: webappify.parse_icon_page(html, BASE_URL, backend), args.repeat)
+            results[backend] = webappify.parse_icon_page(html, BASE_URL, backend)
+        if len({repr(r) for r in results.values()}) > 1:
+            mismatches += 1
+            print(f"MISMATCH on {name}: {results}", file=sys.stderr)
+        for c in columns:
+            totals[c] += row[c]
+        print(f"{name[:40]:40} {len(html.encode()) / 1024:7.0f} " + " ".join(f"{row[c] * 1000:9.2f}ms" for c in columns))
+    print(f"{'total':40} {'':7} " + " ".join(f"{totals[c] * 1000:9.2f}ms" for c in columns))
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# End-to-end benchmark of discovery and icon processing against a local server.
+#
+#   python3 benchmarks/bench_pipeline.py [--repeat N] [--output results.json]
+#                                        [--baseline old.json] [--tolerance 0.25]
+#
+# Synthetic sites (small and huge pages, a Web App Manifest, a giant JPEG
+# og:image, slow and failing candidates) and icons in every format we handle are
+# generated and served from 127.0.0.1, so results don't depend on the network.
+# Measured per site: a full `webappify.py` run (wall time and peak RSS, fresh HOME
+# and no cache each time), discover_icon_urls and head parsing; per icon:
+# save_icon_from_url split into decode / resize / encode, plus its traced peak
+# memory. With --baseline, any time or memory figure that grew by more than
+# --tolerance is reported and makes the script exit non-zero.
+import argparse
+import io
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import webappify  # noqa: E402
+
+SLOW_SECONDS = 1.0
+# Runs webappify.py as __main__ and then records the process's peak RSS. VmHWM is used
+# rather than wait4()'s ru_maxrss, which on Linux carries over this (fixture-laden)
+# parent's high-water mark into the child
+RSS_WRAPPER = """
+import os, runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    with open("/proc/self/status") as f:
+        hwm = next((line.split()[1] for line in f if line.startswith("VmHWM:")), "0")
+    with open(os.environ["BENCH_RSS_FILE"], "w") as f:
+        f.write(hwm)
+"""
+
+def png(side, color=(40, 120, 200, 255)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGBA", (side, side), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+def ico(sides):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGBA", (max(sides), max(sides)), (200, 60, 40, 255)).save(buf, format="ICO", sizes=[(s, s) for s in sides])
+    return buf.getvalue()
+
+def jpeg(width, height):
+    from PIL import Image
+    # A gradient rather than a flat fill, so the encoder and decoder do real work
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+SVG = (b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64">'
+       b'<rect width="64" height="64" rx="12" fill="#2a7"/><circle cx="32" cy="32" r="18" fill="#fff"/></svg>')
+
+def page(title, links, body_kb=1, og=None):
+    head = [f"<meta charset=utf-8><title>{title}</title>"]
+    if og:
+        head.append(f'<meta property="og:image" content="{og}">')
+    head.extend(links)
+    body = "<div class=row><p>lorem ipsum dolor sit amet</p></div>\n" * (body_kb * 1024 // 55)
+    return f"<!doctype html><html><head>{''.join(head)}</head><body>{body}</body></html>".encode()
+
+def fixtures():
+    # path -> (status, content type, body, delay in seconds)
+    icons = {
+        "tiny.png": ("image/png", png(16)),
+        "touch.png": ("image/png", png(180)),
+        "large.png": ("image/png", png(512)),
+        "multi.ico": ("image/x-icon", ico([16, 32, 48, 256])),
+        "huge.jpg": ("image/jpeg", jpeg(6000, 4000)),
+        "logo.svg": ("image/svg+xml", SVG),
+    }
+    routes = {f"/icons/{name}": (200, ctype, body, 0) for name, (ctype, body) in icons.items()}
+    filler = [f'<link rel="{("stylesheet", "preload", "alternate")[i % 3]}" href="/asset-{i}.css">' for i in range(196)]
+    manifest = {"name": "Manifest", "icons": [{"src": "/icons/logo.svg", "sizes": "any", "type": "image/svg+xml"},
+                                               {"src": "/icons/large.png", "sizes": "512x512"}]}
+    routes.update({
+        "/small/": (200, "text/html", page("Small", ['<link rel="icon" href="/icons/tiny.png" sizes="16x16">',
+                                                      '<link rel="shortcut icon" href="/icons/multi.ico">']), 0),
+        "/large/": (200, "text/html", page("Large", filler + ['<link rel="apple-touch-icon" href="/icons/touch.png">',
+                                                              '<link rel="icon" href="/icons/multi.ico">'],
+                                           body_kb=2000), 0),
+        "/manifest/": (200, "text/html", page("Manifest", ['<link rel="manifest" href="/manifest/app.webmanifest">']), 0),
+        "/manifest/app.webmanifest": (200, "application/manifest+json", json.dumps(manifest).encode(), 0),
+        "/og-jpeg/": (200, "text/html", page("Photo", [], og="/icons/huge.jpg"), 0),
+        "/slow-failing/": (200, "text/html", page("Flaky", ['<link rel="icon" href="/slow/icon.png" sizes="512x512">',
+                                                             '<link rel="icon" href="/broken/icon.png" sizes="256x256">',
+                                                             '<link rel="icon" href="/missing/icon.png" sizes="192x192">',
+                                                             '<link rel="icon" href="/icons/touch.png" sizes="180x180">']), 0),
+        "/slow/icon.png": (200, "image/png", icons["large.png"][1], SLOW_SECONDS),
+        "/broken/icon.png": (500, "text/plain", b"boom\n", 0),
+    })
+    return routes, icons
+
+SITES = ("small", "large", "manifest", "og-jpeg", "slow-failing")
+
+def serve(routes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            status, ctype, body, delay = routes.get(self.path.split("?")[0], (404, "text/plain", b"not found\n", 0))
+            if delay:
+                time.sleep(delay)
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def summarize(samples):
+    return {"ms": round(statistics.median(samples) * 1000, 3), "min_ms": round(min(samples) * 1000, 3),
+            "runs": len(samples)}
+
+def bench_e2e(base, site, repeat):
+    # A real CLI run per sample: fresh HOME, so no icon memo or registry carries over
+    samples, rss = [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as home:
+            rss_file = pathlib.Path(home) / "rss"
+            env = {**os.environ, "HOME": home, "BENCH_RSS_FILE": str(rss_file)}
+            cmd = [sys.executable, "-c", RSS_WRAPPER, str(ROOT / "webappify.py"),
+                   "--url", f"{base}/{site}/", "--name", site, "--no-cache", "--no-daemon"]
+            t = time.perf_counter()
+            proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            samples.append(time.perf_counter() - t)
+            if proc.returncode != 0:
+                raise RuntimeError(f"webappify failed on {site}")
+            rss.append(int(rss_file.read_text() or 0))
+    return {**summarize(samples), "maxrss_kb": max(rss)}
+
+def bench_discover(base, site, repeat):
+    samples = []
+    for i in range(repeat + 1):
+        t = time.perf_counter()
+        webappify.discover_icon_urls(f"{base}/{site}/")
+        if i:
+            # The first call is a warm-up that also imports httpx
+            samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+def bench_parse(html, url, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        webappify.parse_icon_page(html, url)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+def bench_icon(base, name, repeat, tmp):
+    # save_icon_from_url with a fresh icon store each time, so every sample decodes;
+    # the phase split comes from webappify's own --timings spans
+    phases = {"decode": [], "resize": [], "encode": []}
+    samples, peaks = [], []
+    for i in range(repeat + 1):
+        webappify.ICON_STORE = tmp / f"store-{name}-{i}"
+        webappify.TIMINGS = webappify.Timings()
+        tracemalloc.start()
+        t = time.perf_counter()
+        try:
+            webappify.save_icon_from_url(f"{base}/icons/{name}", tmp / f"{name}-{i}")
+        finally:
+            elapsed = time.perf_counter() - t
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        if i == 0:
+            # Warm-up: the first call also pays for importing httpx and PIL
+            continue
+        samples.append(elapsed)
+        peaks.append(peak)
+        totals = webappify.TIMINGS.totals()
+        for phase in phases:
+            phases[phase].append(totals.get(phase, {}).get("ms", 0.0))
+    webappify.TIMINGS = None
+    result = summarize(samples)
+    for phase, values in phases.items():
+        result[f"{phase}_ms"] = round(statistics.median(values), 3)
+    result["peak_kb"] = max(peaks) // 1024
+    return result
+
+def compare(results, baseline, tolerance):
+    # Every *ms / *_kb figure, new vs baseline; returns the ones that regressed
+    regressions = []
+    for key, metrics in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old:
+            continue
+        for field, value in metrics.items():
+            if not (field.endswith("ms") or field.endswith("_kb")) or field == "min_ms":
+                continue
+            before = old.get(field)
+            # Ignore sub-millisecond noise
+            if before and value > before * (1 + tolerance) and value - before > 1:
+                regressions.append((key, field, before, value))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webappify's discovery and icon pipeline.")
+    parser.add_argument("--repeat", type=int, default=3, help="Samples per measurement; medians are reported")
+    parser.add_argument("--output", metavar="FILE", help="Write results as JSON (use as a later --baseline)")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against earlier --output results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown/growth vs baseline (default 0.25)")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the in-process measurements")
+    args = parser.parse_args()
+    if not webappify.PIL_OK:
+        print("Pillow is needed to generate the icon fixtures", file=sys.stderr)
+        return 2
+
+    webappify.HTTP_CACHE = None
+    webappify.MANIFEST_CACHE = None
+    routes, icons = fixtures()
+    server, base = serve(routes)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            for site in SITES:
+                if not args.skip_e2e:
+                    results[f"e2e/{site}"] = bench_e2e(base, site, args.repeat)
+                results[f"discover/{site}"] = bench_discover(base, site, args.repeat)
+                html = routes[f"/{site}/"][2].decode()
+                results[f"parse/{site}"] = bench_parse(html, f"{base}/{site}/", max(args.repeat, 5))
+            for name in icons:
+                results[f"icon/{name}"] = bench_icon(base, name, args.repeat, tmp)
+    finally:
+        server.shutdown()
+
+    print(f"{'benchmark':24}{'median ms':>11}{'decode':>9}{'resize':>9}{'encode':>9}{'peak KiB':>10}")
+    for key, m in results.items():
+        phases = "".join(f"{m[p]:9.1f}" if p in m else f"{'':9}" for p in ("decode_ms", "resize_ms", "encode_ms"))
+        peak = m.get("peak_kb", m.get("maxrss_kb", ""))
+        print(f"{key:24}{m['ms']:11.1f}{phases}{peak:>10}")
+
+    report = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "repeat": args.repeat},
+              "results": results}
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        for key, field, before, value in regressions:
+            print(f"REGRESSION {key} {field}: {before} -> {value}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Startup-time regression check, driven by `python -X importtime`.
+#
+#   python3 benchmarks/check_startup.py [--budget-ms 100]
+#
+# Runs `webappify.py --help` and fails if any of the heavy modules that are
+# meant to be imported lazily got loaded, or if total import time exceeds
+# the budget (best of several runs, to ride out a cold disk cache).
+import argparse
+import pathlib
+import subprocess
+import sys
+
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "webappify.py"
+LAZY_MODULES = ("httpx", "bs4", "lxml", "PIL", "asyncio")
+
+def import_times():
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(SCRIPT), "--help"],
+                          capture_output=True, text=True, check=True)
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    times = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+        # Nested imports are indented; only top-level ones add to the total
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return times, total
+
+def main():
+    parser = argparse.ArgumentParser(description="Check webappify CLI startup cost.")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="Maximum total import time (default 100ms)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs; the fastest is compared to the budget")
+    args = parser.parse_args()
+
+    best_total = None
+    for _ in range(max(1, args.runs)):
+        times, total = import_times()
+        best_total = total if best_total is None else min(best_total, total)
+
+    failures = []
+    loaded = sorted(m for m in times if m.split(".")[0] in LAZY_MODULES)
+    if loaded:
+        failures.append(f"heavy modules imported at startup: {', '.join(loaded)}")
+    if best_total / 1000 > args.budget_ms:
+        failures.append(f"imports took {best_total / 1000:.1f}ms, budget is {args.budget_ms:.0f}ms")
+
+    slowest = sorted(times.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    print(f"startup imports: {best_total / 1000:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    for name, us in slowest:
+        print(f"  {us / 1000:7.1f}ms  {name}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# Tests for the asyncio engine against a throwaway http.server on 127.0.0.1.
+#
+#   python3 -m unittest discover tests
+import asyncio
+import contextlib
+import io
+import json
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import webappify  # noqa: E402
+
+def png(side):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGBA", (side, side), (40, 120, 200, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+class Server:
+    # routes: path -> (status, headers dict, body, delay in seconds). Records the most
+    # slow (delayed) requests that were ever in flight at once
+    def __init__(self, routes):
+        self.routes = routes
+        self.lock = threading.Lock()
+        self.slow = 0
+        self.peak_slow = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                status, headers, body, delay = server.routes.get(path, (404, {}, b"not found\n", 0))
+                if delay:
+                    with server.lock:
+                        server.slow += 1
+                        server.peak_slow = max(server.peak_slow, server.slow)
+                try:
+                    if delay:
+                        time.sleep(delay)
+                    self.send_response(status)
+                    for k, v in headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    if delay:
+                        with server.lock:
+                            server.slow -= 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def html(title, links):
+    return f"<!doctype html><html><head><title>{title}</title>{''.join(links)}</head><body>hi</body></html>".encode()
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+PNG = {"Content-Type": "image/png"}
+
+class EngineTest(unittest.TestCase):
+    def setUp(self):
+        # Every path webappify writes to, plus its caches, goes into a scratch dir
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = pathlib.Path(tmp.name)
+        share = self.tmp / "share"
+        for name, value in {
+            "APP_DIR": share / "applications",
+            "ICON_DIR": share / "icons" / "webapps",
+            "ICON_STORE": share / "webappify" / "icons",
+            "HICOLOR_DIR": share / "icons" / "hicolor",
+            "REGISTRY_PATH": share / "webappify" / "registry.sqlite3",
+            "STAGING_DIR": share / "webappify" / "staging",
+            "PROFILE_BASE": self.tmp / "profiles",
+            "HTTP_CACHE": None,
+            "MANIFEST_CACHE": None,
+        }.items():
+            patcher = mock.patch.object(webappify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        webappify.ensure_dirs()
+
+    def run_engine(self, coro_fn, *args, **kwargs):
+        async def runner():
+            async with webappify.make_client() as client:
+                return await coro_fn(*args, client=client, **kwargs)
+        return asyncio.run(runner())
+
+    def test_discover_follows_redirects_and_reads_manifest(self):
+        manifest = {"icons": [{"src": "/icons/512.png", "sizes": "512x512", "type": "image/png"}]}
+        routes = {
+            "/old/": (301, {"Location": "/app/"}, b"", 0),
+            "/app/": (200, HTML, html("Example App", ['<link rel="manifest" href="app.webmanifest">',
+                                                      '<link rel="icon" href="/favicon-32.png" sizes="32x32">']), 0),
+            "/app/app.webmanifest": (200, {"Content-Type": "application/manifest+json"}, json.dumps(manifest).encode(), 0),
+        }
+        with Server(routes) as server:
+            candidates, title, final_url = self.run_engine(webappify.discover_icon_urls_async, server.base + "/old/")
+        self.assertEqual(title, "Example App")
+        self.assertEqual(final_url, server.base + "/app/")
+        # Manifest icons lead, then <link rel=icon>
+        self.assertEqual(candidates[0], server.base + "/icons/512.png")
+        self.assertIn(server.base + "/favicon-32.png", candidates)
+
+    def test_discover_unreachable_page(self):
+        with Server({}) as server:
+            candidates, title, final_url = self.run_engine(webappify.discover_icon_urls_async, server.base + "/gone/")
+            self.assertEqual((candidates, title, final_url), ([], None, server.base + "/gone/"))
+            with self.assertRaises(Exception):
+                self.run_engine(webappify.discover_icon_urls_async, server.base + "/gone/", strict=True)
+
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_save_icon_resizes_to_png(self):
+        from PIL import Image
+        with Server({"/icon.png": (200, PNG, png(300), 0)}) as server:
+            path = self.run_engine(webappify.save_icon_from_url_async, server.base + "/icon.png",
+                                   webappify.ICON_DIR / "example", size_px=64)
+        self.assertEqual(path, webappify.ICON_DIR / "example.png")
+        with Image.open(path) as img:
+            self.assertEqual((img.format, img.size), ("PNG", (64, 64)))
+
+    def test_save_icon_rejects_non_images(self):
+        with Server({"/icon.png": (200, HTML, html("Not found", []) * 40, 0)}) as server:
+            with self.assertRaises(ValueError):
+                self.run_engine(webappify.save_icon_from_url_async, server.base + "/icon.png",
+                                webappify.ICON_DIR / "example")
+        self.assertFalse(webappify.ICON_DIR.joinpath("example.png").exists())
+
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_probe_does_not_wait_for_unresponsive_candidates(self):
+        routes = {"/slow.jpg": (200, {"Content-Type": "image/jpeg"}, b"", 5), "/512.png": (200, PNG, png(512), 0)}
+        with Server(routes) as server, mock.patch.object(webappify, "PROBE_DEADLINE", 0.3):
+            started = time.monotonic()
+            ranked, prefetched = self.run_engine(webappify.probe_and_rank_icons,
+                                                 [server.base + "/slow.jpg", server.base + "/512.png"], size_px=256)
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 2)
+        # The unanswered candidate is kept, as an image of unknown size
+        self.assertEqual(ranked, [server.base + "/512.png", server.base + "/slow.jpg"])
+
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_probed_icon_is_cached_under_its_own_url(self):
+        # A small icon is read whole by the probe; refresh revalidates it by its plain URL
+        routes = {"/app/": (200, HTML, html("App", ['<link rel="icon" href="/i.png" sizes="64x64">']), 0),
+                  "/i.png": (200, {**PNG, "ETag": '"a"'}, png(64), 0)}
+        with Server(routes) as server, mock.patch.object(webappify, "HTTP_CACHE", webappify.HttpCache(self.tmp / "http")):
+            opts = webappify.build_parser().parse_args(["--url", server.base + "/app/", "--no-icon-theme"])
+            self.run_engine(webappify.create_webapp_async, opts)
+            meta, body = webappify.HTTP_CACHE.load(server.base + "/i.png")
+        self.assertEqual(body, routes["/i.png"][2])
+        self.assertIn(["etag", '"a"'], [[k.lower(), v] for k, v in meta["headers"]])
+
+    def test_batch_runs_at_most_jobs_entries_at_once(self):
+        entries = 6
+        routes = {f"/site{i}/": (200, HTML, html(f"Site {i}", []), 0.2) for i in range(entries)}
+        batch = self.tmp / "apps.json"
+        with Server(routes) as server:
+            batch.write_text(json.dumps([{"url": server.base + f"/site{i}/", "filename": f"site{i}"}
+                                         for i in range(entries)]), encoding="utf-8")
+            args = webappify.build_parser().parse_args(["--batch", str(batch), "--jobs", "2", "--no-icon-theme"])
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                status = asyncio.run(webappify.run_batch_async(args))
+        self.assertEqual(status, 0)
+        self.assertEqual(len(list(webappify.APP_DIR.glob("site*.desktop"))), entries)
+        # Every page is slow, so without the cap all six would be in flight together
+        self.assertEqual(server.peak_slow, 2)
+
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_batch_updates_icon_cache_for_themed_entries(self):
+        routes = {f"/site{i}/": (200, HTML, html(f"Site {i}", ['<link rel="icon" href="/i.png">']), 0) for i in range(2)}
+        routes["/i.png"] = (200, PNG, png(64), 0)
+        batch = self.tmp / "apps.json"
+        for themed_entry, calls in ((False, 0), (True, 1)):
+            with self.subTest(themed_entry=themed_entry), Server(routes) as server, \
+                    mock.patch.object(webappify, "update_icon_cache") as update_icon_cache:
+                # --no-icon-theme for the batch, but one entry may opt back in
+                batch.write_text(json.dumps([{"url": server.base + "/site0/", "filename": "site0", "force": True},
+                                             {"url": server.base + "/site1/", "filename": "site1", "force": True,
+                                              "no-icon-theme": not themed_entry}]), encoding="utf-8")
+                args = webappify.build_parser().parse_args(["--batch", str(batch), "--no-icon-theme"])
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    self.assertEqual(asyncio.run(webappify.run_batch_async(args)), 0)
+                self.assertEqual(update_icon_cache.call_count, calls)
+
+class HttpCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name)
+
+    def store(self, cache, n, size):
+        import httpx
+        for i in range(n):
+            url = f"http://example.test/{i}"
+            cache.store(url, httpx.Response(200, headers={"ETag": f'"{i}"'}, content=b"x" * size,
+                                            request=httpx.Request("GET", url)))
+
+    def disk_size(self):
+        return sum(p.stat().st_size for p in self.root.glob("*.entry"))
+
+    def test_store_scans_only_when_the_cap_is_crossed(self):
+        cache = webappify.HttpCache(self.root, max_bytes=1024 * 1024)
+        with mock.patch.object(pathlib.Path, "glob", autospec=True, side_effect=pathlib.Path.glob) as glob:
+            self.store(cache, 50, 1000)
+        self.assertEqual(glob.call_count, 1)
+
+    def test_eviction_keeps_the_cache_under_its_cap(self):
+        cache = webappify.HttpCache(self.root, max_bytes=20_000)
+        self.store(cache, 60, 1000)
+        self.assertLessEqual(self.disk_size(), 20_000)
+        # The newest entries survive
+        self.assertIsNotNone(cache.load("http://example.test/59"))
+
+if __name__ == "__main__":
+    unittest.main()
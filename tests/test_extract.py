@@ -0,0 +1,27 @@
+# The HTML extraction backends must agree on what a page's <head> holds.
+#
+#   python3 -m unittest discover tests
+import pathlib
+import sys
+import unittest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import webappify  # noqa: E402
+
+BACKENDS = [b for b in webappify.HEAD_EXTRACTORS
+            if not (b == "lxml" and not webappify.LXML_OK) and not (b == "soup" and not webappify.BS4_OK)]
+
+class ExtractTest(unittest.TestCase):
+    def test_repeated_attributes_keep_the_first_value(self):
+        html = ("<!doctype html><html><head><title>Dup</title>"
+                "<link rel=icon href=/a.png href=/b.png sizes=32x32 SIZES=64x64>"
+                "<meta property=og:image content=/og-a.png content=/og-b.png></head><body></body></html>")
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                head = webappify.extract_head(html, backend)
+                self.assertEqual([(link["href"], link["sizes"]) for link in head.links], [("/a.png", "32x32")])
+                self.assertEqual(head.metas[0]["content"], "/og-a.png")
+
+if __name__ == "__main__":
+    unittest.main()
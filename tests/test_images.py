@@ -0,0 +1,149 @@
+# Tests for the image pipeline that need no network: format sniffing, header size
+# parsing, candidate ranking and decoding limits.
+#
+#   python3 -m unittest discover tests
+import pathlib
+import struct
+import sys
+import unittest
+import zlib
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import webappify  # noqa: E402
+
+def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def png_header(width, height):
+    # Signature, IHDR and the start of the pixel data: enough for anything that reads
+    # the dimensions, Image.open included
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(b"\0" * 64))
+
+def jpeg_header(width, height, fill=False):
+    # SOI, an APP0 segment, optionally a fill byte, then a baseline SOF0
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + b"\x01\x01\0\0\x01\0\x01\0\0"
+    sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, height, width, 3) + b"\0" * 9
+    return b"\xff\xd8" + app0 + (b"\xff" if fill else b"") + sof0
+
+def webp(chunk, payload):
+    body = b"WEBP" + chunk + struct.pack("<I", len(payload)) + payload
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+def webp_vp8(width, height):
+    return webp(b"VP8 ", b"\0\0\0" + b"\x9d\x01\x2a" + struct.pack("<HH", width, height) + b"\0" * 8)
+
+def webp_vp8l(width, height):
+    return webp(b"VP8L", b"\x2f" + struct.pack("<I", (width - 1) | (height - 1) << 14) + b"\0" * 8)
+
+def webp_vp8x(width, height):
+    return webp(b"VP8X", b"\0" * 4 + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little"))
+
+def ico(kind, sides):
+    # ICONDIR plus one 16-byte entry per image; a side of 256 is stored as 0
+    entries = b"".join(bytes([side % 256, side % 256]) + b"\0" * 14 for side in sides)
+    return b"\0\0" + struct.pack("<HH", kind, len(sides)) + entries
+
+def bmp(width, height):
+    return b"BM" + b"\0" * 16 + struct.pack("<ii", width, height) + b"\0" * 8
+
+SVG_BODY = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 48 32"><rect/></svg>'
+
+# (name, data, expected probe_image_size()); sniff_image() is its first item
+PROBES = (
+    ("png", png_header(512, 256), ("png", 512, 256)),
+    ("png cut short", png_header(512, 256)[:20], ("png", None, None)),
+    ("jpeg", jpeg_header(640, 480), ("jpeg", 640, 480)),
+    ("jpeg with fill byte", jpeg_header(640, 480, fill=True), ("jpeg", 640, 480)),
+    ("jpeg without SOF", jpeg_header(640, 480)[:20], ("jpeg", None, None)),
+    ("gif87a", b"GIF87a" + struct.pack("<HH", 32, 16) + b"\0" * 8, ("gif", 32, 16)),
+    ("gif89a", b"GIF89a" + struct.pack("<HH", 48, 48) + b"\0" * 8, ("gif", 48, 48)),
+    ("webp lossy", webp_vp8(300, 200), ("webp", 300, 200)),
+    ("webp lossless", webp_vp8l(300, 200), ("webp", 300, 200)),
+    ("webp extended", webp_vp8x(300, 200), ("webp", 300, 200)),
+    ("ico", ico(1, [16, 32, 48]), ("ico", 48, 48)),
+    ("ico 0 means 256", ico(1, [32, 256]), ("ico", 256, 256)),
+    ("cur", ico(2, [32]), ("cur", 32, 32)),
+    ("bmp", bmp(64, 32), ("bmp", 64, 32)),
+    ("bmp top-down", bmp(64, -32), ("bmp", 64, 32)),
+    ("icns", b"icns" + b"\0" * 28, ("icns", None, None)),
+    ("avif", b"\0\0\0\x1cftypavif" + b"\0" * 20, ("avif", None, None)),
+    ("avif sequence", b"\0\0\0\x1cftypavis" + b"\0" * 20, ("avif", None, None)),
+    ("tiff little-endian", b"II*\0" + b"\0" * 28, ("tiff", None, None)),
+    ("tiff big-endian", b"MM\0*" + b"\0" * 28, ("tiff", None, None)),
+    ("svg", SVG_BODY, ("svg", 48, 32)),
+    ("svg with BOM and prolog", b"\xef\xbb\xbf  <?xml version=\"1.0\"?>\n" + SVG_BODY, ("svg", 48, 32)),
+    ("svg after comment", b"<!-- logo -->\n" + SVG_BODY, ("svg", 48, 32)),
+    ("svg after doctype", b'<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN">' + SVG_BODY, ("svg", 48, 32)),
+    ("svg width and height", b'<svg width="24px" height="20">', ("svg", 24, 20)),
+    ("svg without size", b"<svg>", ("svg", 0, 0)),
+    ("html", b"<!doctype html><html><body><svg></svg></body></html>", None),
+    ("xml that isn't svg", b'<?xml version="1.0"?><rss></rss>', None),
+    ("json", b'{"error": "not found"}', None),
+    ("empty", b"", None),
+)
+
+class SniffTest(unittest.TestCase):
+    def test_sniff_image(self):
+        for name, data, expected in PROBES:
+            with self.subTest(name):
+                self.assertEqual(webappify.sniff_image(data), expected and expected[0])
+
+    def test_every_signature_is_covered(self):
+        sniffed = {webappify.sniff_image(data) for _, data, _ in PROBES}
+        self.assertLessEqual({kind for kind, _ in webappify.IMAGE_SIGNATURES} | {"svg"}, sniffed)
+
+class ProbeTest(unittest.TestCase):
+    def test_probe_image_size(self):
+        for name, data, expected in PROBES:
+            with self.subTest(name):
+                self.assertEqual(webappify.probe_image_size(data), expected)
+
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_probe_agrees_with_pillow(self):
+        # The hand-built headers above check edge cases; files Pillow writes check we
+        # read real encoder output the same way
+        import io
+        from PIL import Image, features
+        img = Image.new("RGBA", (96, 60), (200, 60, 40, 255))
+        formats = [("png", "PNG", {}), ("jpeg", "JPEG", {}), ("gif", "GIF", {}), ("bmp", "BMP", {}),
+                   ("ico", "ICO", {"sizes": [(96, 96)]})]
+        if features.check("webp"):
+            formats += [("webp", "WEBP", {"quality": 80}), ("webp", "WEBP", {"lossless": True})]
+        for kind, fmt, params in formats:
+            with self.subTest(fmt=fmt, **params):
+                buf = io.BytesIO()
+                src = img.convert("RGB") if fmt == "JPEG" else img.resize((96, 96)) if fmt == "ICO" else img
+                src.save(buf, format=fmt, **params)
+                self.assertEqual(webappify.probe_image_size(buf.getvalue()[:webappify.PROBE_BYTES]), (kind, *src.size))
+
+class RankTest(unittest.TestCase):
+    def test_rank_probed_icons(self):
+        cases = (
+            # (name, probed in page order, expected ranking for a 128 px icon)
+            ("big enough beats smaller, page order among big ones",
+             [("a", ("png", 64, 64)), ("b", ("png", 256, 256)), ("c", ("png", 512, 512))], ["b", "c", "a"]),
+            ("svg counts as big enough", [("a", ("png", 64, 64)), ("b", ("svg", 0, 0))], ["b", "a"]),
+            ("smaller ones largest first", [("a", ("png", 16, 16)), ("b", ("ico", 48, 48)), ("c", ("png", 32, 32))],
+             ["b", "c", "a"]),
+            ("non-square judged by the short side", [("a", ("png", 400, 100)), ("b", ("png", 120, 120))], ["b", "a"]),
+            ("unknown size after known sizes", [("a", ("png", None, None)), ("b", ("png", 16, 16))], ["b", "a"]),
+            ("jpeg loses ties", [("a", ("jpeg", 512, 512)), ("b", ("png", 256, 256))], ["b", "a"]),
+            ("non-images dropped", [("a", None), ("b", ("gif", 32, 32))], ["b"]),
+        )
+        for name, probed, expected in cases:
+            with self.subTest(name):
+                self.assertEqual(webappify.rank_probed_icons(probed, 128), expected)
+
+class RenderTest(unittest.TestCase):
+    @unittest.skipUnless(webappify.PIL_OK, "needs Pillow")
+    def test_oversized_images_are_refused(self):
+        # Under Pillow's own bomb limit our cap applies; past it Pillow refuses at open.
+        # Neither may fall through to installing the raw bytes
+        for side in (8000, 15000):
+            with self.subTest(side=side), self.assertRaises(ValueError):
+                webappify.render_icons(png_header(side, side), {256})
+
+if __name__ == "__main__":
+    unittest.main()
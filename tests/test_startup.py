@@ -0,0 +1,34 @@
+# Startup regression tests: commands that don't touch the network or decode images
+# must not pay for loading the heavy modules (see benchmarks/check_startup.py for
+# the timing budget).
+#
+#   python3 -m unittest discover tests
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "webappify.py"
+LAZY_MODULES = ("httpx", "bs4", "lxml", "PIL", "asyncio")
+
+def imported_modules(*argv):
+    # Every module `python -X importtime webappify.py ARGV` loaded, with a throwaway
+    # HOME so that commands reading the registry don't see the real one
+    with tempfile.TemporaryDirectory() as home:
+        proc = subprocess.run([sys.executable, "-X", "importtime", str(SCRIPT), *argv],
+                              env={**os.environ, "HOME": home}, capture_output=True, text=True, check=True)
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    return {line.rpartition("|")[2].strip() for line in proc.stderr.splitlines()
+            if line.startswith("import time:") and "[us]" not in line}
+
+class StartupTest(unittest.TestCase):
+    def test_light_commands_skip_heavy_imports(self):
+        for argv in (["--help"], ["list"]):
+            with self.subTest(argv=argv):
+                loaded = sorted(m for m in imported_modules(*argv) if m.split(".")[0] in LAZY_MODULES)
+                self.assertEqual(loaded, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Minimal front end for a running `webappify.py serve`: takes the same arguments as
+# webappify.py, but only loads json and socket, so a forwarded launcher costs little
+# more than interpreter startup. When no daemon is listening, or the command is one
+# the daemon leaves to the CLI (subcommands, --batch, --timings, ...), it runs
+# webappify.py in-process instead.
+import json
+import os
+import socket
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webappify.py")
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache/webappify"),
+                           "webappify.sock")
+# Same as webappify.FORWARD_TIMEOUT
+FORWARD_TIMEOUT = 60
+
+def forward(argv):
+    # The daemon's reply, or None if there's no daemon or it didn't answer properly
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(FORWARD_TIMEOUT)
+    try:
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        request = {"op": "run", "argv": argv, "cwd": os.getcwd(), "home": os.path.expanduser("~"),
+                   "browser": os.environ.get("WEBAPP_BROWSER")}
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return json.loads(b"".join(chunks))
+        except (OSError, ValueError):
+            return None
+
+def main():
+    argv = sys.argv[1:]
+    reply = forward(argv) if argv and not argv[0].isalpha() else None
+    if reply is None or reply.get("local"):
+        os.execv(sys.executable, [sys.executable, SCRIPT, *argv])
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    sys.exit(reply["status"])
+
+if __name__ == "__main__":
+    main()
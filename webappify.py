@@ -1,41 +1,178 @@
 #!/usr/bin/env python3
+# httpx, bs4, lxml and PIL are imported where they are used, not here: --help,
+# list/show/remove and calls forwarded to `serve` never load them, and an install
+# only loads PIL when an icon actually has to be decoded
+from __future__ import annotations
+
 import argparse
 import os
 import re
 import sys
 import shutil
+import subprocess
 import pathlib
-import imghdr
+import csv
+import json
+import time
+import codecs
+import hashlib
+import tempfile
+import fcntl
+import io
+import functools
+import contextlib
+import contextvars
+import importlib.util
+from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
+from typing import TYPE_CHECKING
 
-import requests
-from bs4 import BeautifulSoup
+if TYPE_CHECKING:
+    import httpx
 
-try:
-    from PIL import Image
-    PIL_OK = True
-except Exception:
-    PIL_OK = False
+BS4_OK = importlib.util.find_spec("bs4") is not None
+LXML_OK = importlib.util.find_spec("lxml") is not None
+PIL_OK = importlib.util.find_spec("PIL") is not None
 
 HOME = pathlib.Path.home()
 APP_DIR = HOME / ".local" / "share" / "applications"
 ICON_DIR = HOME / ".local" / "share" / "icons" / "webapps"
+ICON_STORE = HOME / ".local" / "share" / "webappify" / "icons"
+HICOLOR_DIR = HOME / ".local" / "share" / "icons" / "hicolor"
+HICOLOR_SIZES = (16, 24, 32, 48, 64, 128, 256, 512)
+REGISTRY_PATH = HOME / ".local" / "share" / "webappify" / "registry.sqlite3"
+STAGING_DIR = HOME / ".local" / "share" / "webappify" / "staging"
 PROFILE_BASE = HOME / ".cache" / "ChromiumWebApps"
+USER_AGENT = "webappify/1.0"
+CACHE_DIR = HOME / ".cache" / "webappify"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Where `webappify.py serve` listens and the CLI looks for it
+SOCKET_PATH = pathlib.Path(os.environ.get("XDG_RUNTIME_DIR") or CACHE_DIR) / "webappify.sock"
+# A forwarded run that hasn't answered by then is redone in-process
+FORWARD_TIMEOUT = 60
+# Safety net for pages whose <head> never ends
+HEAD_MAX_BYTES = 512 * 1024
+# Parsed Web App Manifests are reused (per manifest URL) for this long
+MANIFEST_TTL = 24 * 3600
+# Icon downloads bigger than this are abandoned (--max-icon-bytes)
+ICON_MAX_BYTES = 5 * 1024 * 1024
+# Refuse to decode anything larger; an icon never needs this many pixels
+MAX_IMAGE_PIXELS = 40_000_000
+# Enough to reach the dimensions in every format we probe, barring huge JPEG EXIF blocks
+PROBE_BYTES = 16 * 1024
+# Probing is only for ranking: candidates still unanswered by then rank as unknown size
+# rather than holding up the install for a full fetch timeout
+PROBE_DEADLINE = 2.0
 
 def slugify(name: str) -> str:
     s = re.sub(r"[^\w\s-]", "", name).strip().lower()
     s = re.sub(r"[\s_-]+", "-", s)
     return s or "webapp"
 
-def pick_best_icon_links(soup: BeautifulSoup, base_url: str):
+class PageHead:
+    # The only parts of a page that icon discovery looks at: every <link> and <meta>
+    # as an attribute dict (rel split into a token list) plus the first <title>
+    def __init__(self, links=None, metas=None, title=None):
+        self.links = links or []
+        self.metas = metas or []
+        self.title = title
+
+def _head_attrs(tag: str, attrs) -> dict:
+    # attrs: (name, value) pairs in source order. A repeated attribute keeps its first
+    # value, as browsers do, so that every backend reads <link href=a href=b> alike
+    pairs, attrs = attrs, {}
+    for k, v in pairs:
+        attrs.setdefault(k.lower(), v if v is not None else "")
+    if tag == "link" and "rel" in attrs and not isinstance(attrs["rel"], list):
+        attrs["rel"] = attrs["rel"].split()
+    return attrs
+
+class HeadExtractor(HTMLParser):
+    # Event-driven extractor: never builds a tree, just records the tags we need
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.head = PageHead()
+        self._title = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("link", "meta"):
+            items = self.head.links if tag == "link" else self.head.metas
+            items.append(_head_attrs(tag, attrs))
+        elif tag == "title" and self.head.title is None and self._title is None:
+            self._title = []
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title is not None:
+            self.head.title = "".join(self._title)
+            self._title = None
+
+def extract_head_htmlparser(html: str) -> PageHead:
+    parser = HeadExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.head
+
+def extract_head_soup(html: str) -> PageHead:
+    from bs4 import BeautifulSoup, SoupStrainer
+    # SoupStrainer keeps bs4 from materializing anything but these three tags
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(["link", "meta", "title"]),
+                         on_duplicate_attribute="ignore")
+    head = PageHead()
+    for tag in soup.find_all(["link", "meta"]):
+        items = head.links if tag.name == "link" else head.metas
+        items.append(_head_attrs(tag.name, tag.attrs.items()))
+    if soup.title:
+        head.title = soup.title.get_text()
+    return head
+
+def extract_head_lxml(html: str) -> PageHead:
+    import lxml.html
+    head = PageHead()
+    if not html.strip():
+        return head
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except Exception:
+        return head
+    for el in doc.iter("link", "meta", "title"):
+        if el.tag == "title":
+            if head.title is None:
+                head.title = el.text_content()
+            continue
+        items = head.links if el.tag == "link" else head.metas
+        items.append(_head_attrs(el.tag, el.attrib.items()))
+    return head
+
+HEAD_EXTRACTORS = {
+    "htmlparser": extract_head_htmlparser,
+    "soup": extract_head_soup,
+    "lxml": extract_head_lxml,
+}
+
+def extract_head(html: str, backend: str = "auto") -> PageHead:
+    if backend == "auto":
+        backend = "lxml" if LXML_OK else "htmlparser"
+    if backend not in HEAD_EXTRACTORS:
+        raise ValueError(f"unknown HTML parser backend {backend!r}")
+    if (backend == "lxml" and not LXML_OK) or (backend == "soup" and not BS4_OK):
+        raise RuntimeError(f"HTML parser backend {backend!r} is not installed")
+    head = HEAD_EXTRACTORS[backend](html)
+    head.title = (head.title.strip() or None) if head.title else None
+    return head
+
+def pick_best_icon_links(head: PageHead, base_url: str):
     # Collect rel=icon and apple-touch-icon candidates
     rel_icons = []
-    for link in soup.find_all("link"):
+    for link in head.links:
         rel = link.get("rel", [])
         href = link.get("href")
         if not href:
             continue
-        rel_lower = [r.lower() for r in rel] if isinstance(rel, list) else [str(rel).lower()]
+        rel_lower = [r.lower() for r in rel]
         if any(r in {"icon", "shortcut icon", "apple-touch-icon", "apple-touch-icon-precomposed", "mask-icon"} for r in rel_lower):
             sizes_attr = link.get("sizes", "")
             size_val = 0
@@ -51,28 +188,795 @@ def pick_best_icon_links(soup: BeautifulSoup, base_url: str):
     rel_icons.sort(key=lambda x: x[0], reverse=True)
     return [u for _, u in rel_icons]
 
-def find_og_image(soup: BeautifulSoup, base_url: str):
-    meta = soup.find("meta", attrs={"property": "og:image"}) or soup.find("meta", attrs={"name": "og:image"})
+def find_og_image(head: PageHead, base_url: str):
+    meta = next((m for m in head.metas if m.get("property") == "og:image"), None) or \
+        next((m for m in head.metas if m.get("name") == "og:image"), None)
     if meta and meta.get("content"):
         return urljoin(base_url, meta["content"])
     return None
 
-def fetch(url, session: requests.Session, timeout=15):
-    r = session.get(url, timeout=timeout, allow_redirects=True, headers={"User-Agent": "webappify/1.0"})
-    r.raise_for_status()
-    return r
+def make_client(max_connections: int = 100) -> httpx.AsyncClient:
+    # One pooled client per event loop; every fetch in a run multiplexes over it
+    import httpx
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    transport = None
+    if CASSETTE is not None:
+        transport = CASSETTE.transport(httpx.AsyncHTTPTransport(limits=limits))
+    return httpx.AsyncClient(headers={"User-Agent": USER_AGENT}, limits=limits, follow_redirects=True,
+                             transport=transport)
+
+class Cassette:
+    # A directory of recorded HTTP responses, one "<sha256 of url>.entry" file each:
+    # a JSON header line (url, status, headers) followed by the body exactly as it came
+    # off the wire (still compressed, if it was). --record fills one; --replay serves it
+    # back from a local stand-in server, so the whole pipeline runs without network
+    DROP_HEADERS = {"transfer-encoding", "connection", "keep-alive", "content-length"}
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+
+    def path_for(self, url: str) -> pathlib.Path:
+        return self.root / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.entry"
+
+    def save(self, url: str, status: int, headers, body: bytes):
+        meta = {"url": url, "status": status,
+                "headers": [[k, v] for k, v in headers if k.lower() not in self.DROP_HEADERS]}
+        atomic_write(self.path_for(url), json.dumps(meta).encode("utf-8") + b"\n" + body)
+
+    def load(self, url: str):
+        try:
+            with self.path_for(url).open("rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return (meta, body) if meta.get("url") == url else None
+
+class RecordingTransport:
+    # httpx transport wrapper that saves every response into a cassette. Range and
+    # conditional headers are dropped so the server always sends the whole resource:
+    # callers cope with a 200 where they asked for a range, and the cassette can then
+    # answer any later request for the URL
+    SKIP_HEADERS = {"range", "if-none-match", "if-modified-since"}
+
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def handle_async_request(self, request):
+        import httpx
+        headers = [(k, v) for k, v in request.headers.multi_items() if k.lower() not in self.SKIP_HEADERS]
+        sent = httpx.Request(request.method, request.url, headers=headers, extensions=request.extensions)
+        response = await self.inner.handle_async_request(sent)
+        try:
+            body = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        self.cassette.save(str(request.url), response.status_code, response.headers.multi_items(), body)
+        return httpx.Response(response.status_code, headers=response.headers, content=body,
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    async def __aenter__(self):
+        await self.inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.inner.__aexit__(*exc)
+
+class ReplayTransport(RecordingTransport):
+    # Sends every request to the stand-in server instead, naming the real URL in a header.
+    # Redirects, cache validators and Range still round-trip through real HTTP, so
+    # timings include a genuine (local) connection
+    def __init__(self, inner, base_url: str):
+        self.inner = inner
+        self.base_url = base_url
+
+    async def handle_async_request(self, request):
+        import httpx
+        headers = [*request.headers.multi_items(), ("x-webappify-url", str(request.url))]
+        sent = httpx.Request(request.method, self.base_url, headers=headers, extensions=request.extensions)
+        return await self.inner.handle_async_request(sent)
+
+class Recorder:
+    def __init__(self, root: pathlib.Path):
+        self.cassette = Cassette(root)
+        root.mkdir(parents=True, exist_ok=True)
+
+    def transport(self, inner):
+        return RecordingTransport(inner, self.cassette)
+
+class ReplayServer:
+    # Local stand-in for the recorded sites, on a background thread. latency (seconds)
+    # delays every response; bandwidth (bytes/s) paces bodies
+    def __init__(self, root: pathlib.Path, latency: float = 0, bandwidth: int = None):
+        from http.server import ThreadingHTTPServer
+        self.cassette = Cassette(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
 
-def discover_icon_urls(page_url: str, session: requests.Session):
+    def transport(self, inner):
+        return ReplayTransport(inner, self.url)
+
+    def start(self):
+        import threading
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+        from http.server import BaseHTTPRequestHandler
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = self.headers.get("x-webappify-url", "")
+                entry = replay.cassette.load(url)
+                if replay.latency:
+                    time.sleep(replay.latency)
+                if entry is None:
+                    print(f"replay: nothing recorded for {url}", file=sys.stderr)
+                    self.respond(404, [("Content-Type", "text/plain")], b"not in cassette\n")
+                    return
+                meta, body = entry
+                headers = meta["headers"]
+                status = meta["status"]
+                names = {k.lower(): v for k, v in headers}
+                etag, modified = names.get("etag"), names.get("last-modified")
+                if status == 200 and ((etag and self.headers.get("if-none-match") == etag) or
+                                      (modified and self.headers.get("if-modified-since") == modified)):
+                    self.respond(304, [(k, v) for k, v in headers if k.lower() in ("etag", "last-modified", "cache-control", "expires")], b"")
+                    return
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("range", ""))
+                if status == 200 and match and int(match.group(1)) < len(body):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(body) - 1, len(body) - 1)
+                    headers = [*headers, ("Content-Range", f"bytes {start}-{end}/{len(body)}")]
+                    status, body = 206, body[start:end + 1]
+                self.respond(status, headers, body)
+
+            def respond(self, status, headers, body):
+                self.send_response(status)
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    if not replay.bandwidth:
+                        self.wfile.write(body)
+                        return
+                    chunk = 16 * 1024
+                    for i in range(0, len(body), chunk):
+                        self.wfile.write(body[i:i + chunk])
+                        time.sleep(len(body[i:i + chunk]) / replay.bandwidth)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading early (head scan, probe, cancelled candidate)
+                    pass
+
+        return Handler
+
+# Set by --record (a Recorder) or --replay (a running ReplayServer)
+CASSETTE = None
+
+def run_sync(coro_fn, *args, **kwargs):
+    # Blocking entry point into the async engine: runs coro_fn with a fresh client
+    import asyncio
+    async def runner():
+        async with make_client() as client:
+            return await coro_fn(*args, client=client, **kwargs)
+    return asyncio.run(runner())
+
+def atomic_write(path: pathlib.Path, data: bytes):
+    # Write to a temp file in the same directory, then rename over the target
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
     try:
-        r = fetch(page_url, session)
-    except Exception:
-        # Later try /favicon.ico fallback
-        return [], None, page_url
-    final_url = r.url
-    soup = BeautifulSoup(r.text, "html.parser")
-    rel_candidates = pick_best_icon_links(soup, final_url)
-    og = find_og_image(soup, final_url)
+        with os.fdopen(fd, "wb") as f:
+            # mkstemp creates 0600; launchers and icons must stay world-readable
+            os.fchmod(f.fileno(), 0o644)
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def same_bytes(path: pathlib.Path, data: bytes) -> bool:
+    try:
+        return path.stat().st_size == len(data) and path.read_bytes() == data
+    except OSError:
+        return False
+
+def install_file(path: pathlib.Path, data: bytes) -> bool:
+    # Write a launcher-side file only if its content changed, leaving identical files
+    # (and their mtimes, which desktop caches key on) untouched. True if it was written
+    if same_bytes(path, data):
+        return False
+    txn = STAGING.get()
+    atomic_write(txn.stage(path) if txn else path, data)
+    return True
+
+class Transaction:
+    # Files one app installs (launcher, icon links), staged so that a whole batch lands
+    # at once. Writers put their output at stage(dest) instead of dest; commit() renames
+    # everything into place and then runs the deferred work (the registry update).
+    # Nothing shows up in the desktop's watched dirs until then, so menus are rebuilt
+    # once per batch instead of once per launcher
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self.moves = {}
+        self.deferred = []
+
+    def stage(self, dest: pathlib.Path) -> pathlib.Path:
+        staged = self.root / f"{os.urandom(8).hex()}{dest.suffix}"
+        self.moves[dest] = staged
+        return staged
+
+    def defer(self, fn):
+        self.deferred.append(fn)
+
+    def touches(self, root: pathlib.Path) -> bool:
+        # Whether anything staged lands under root (say, HICOLOR_DIR: the icon cache needs updating)
+        return any(root in dest.parents for dest in self.moves)
+
+    def commit(self):
+        for dest, staged in self.moves.items():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(staged, dest)
+            except OSError:
+                # Staging and target on different filesystems: copy next to dest, then rename
+                tmp = dest.with_name(f".{dest.name}.{os.urandom(4).hex()}.tmp")
+                shutil.copy2(staged, tmp)
+                os.replace(tmp, dest)
+        for fn in self.deferred:
+            fn()
+
+@contextlib.contextmanager
+def staging_area():
+    # A scratch dir for transactions, next to (usually on the same filesystem as) the targets
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    root = pathlib.Path(tempfile.mkdtemp(dir=STAGING_DIR))
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+# The transaction the current app is being installed into, if any. A context variable
+# so that concurrent batch workers (and the threads they hand icon work to) each see their own
+STAGING = contextvars.ContextVar("webappify_staging", default=None)
+
+def parse_cache_control(value: str):
+    directives = {}
+    for part in (value or "").split(","):
+        key, _, arg = part.strip().partition("=")
+        if key:
+            directives[key.lower()] = arg.strip('"')
+    return directives
+
+class HttpCache:
+    # Disk-backed HTTP cache shared by every webappify process. Each URL is one
+    # "<sha256>.entry" file: a JSON header line followed by the body. Entries are
+    # replaced atomically, so readers never see a torn write, and mtime doubles as
+    # the LRU clock that eviction (serialized by a lock file) works from.
+
+    # Headers that describe the wire encoding, not the stored (decoded) body
+    HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+    def __init__(self, root: pathlib.Path, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Running estimate of the cache's size: measured by the first eviction check, then
+        # grown by every entry this process writes (replacements too, so it errs high).
+        # Only crossing the cap costs a directory scan
+        self.size = None
+
+    def path_for(self, url: str) -> pathlib.Path:
+        return self.root / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.entry"
+
+    def load(self, url: str):
+        path = self.path_for(url)
+        try:
+            with path.open("rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta, body
+
+    def is_fresh(self, meta) -> bool:
+        return meta.get("expires_at") is not None and time.time() < meta["expires_at"]
+
+    def validators(self, meta):
+        headers = {}
+        stored = {k.lower(): v for k, v in meta["headers"]}
+        if "etag" in stored:
+            headers["If-None-Match"] = stored["etag"]
+        if "last-modified" in stored:
+            headers["If-Modified-Since"] = stored["last-modified"]
+        return headers
+
+    def freshness(self, headers):
+        # Absolute expiry time from Cache-Control/Expires; None means "revalidate every time"
+        cc = parse_cache_control(headers.get("cache-control"))
+        if "no-cache" in cc:
+            return None
+        for key in ("s-maxage", "max-age"):
+            if key in cc:
+                try:
+                    return time.time() + max(0, int(cc[key]))
+                except ValueError:
+                    return None
+        if headers.get("expires"):
+            from email.utils import parsedate_to_datetime
+            try:
+                return parsedate_to_datetime(headers["expires"]).timestamp()
+            except (TypeError, ValueError):
+                return None
+        return None
+
+    def store(self, url: str, r: httpx.Response):
+        cc = parse_cache_control(r.headers.get("cache-control"))
+        if r.status_code != 200 or "no-store" in cc:
+            return
+        expires_at = self.freshness(r.headers)
+        if expires_at is None and "etag" not in r.headers and "last-modified" not in r.headers:
+            # Neither fresh nor revalidatable: caching it could never save a transfer
+            return
+        meta = {
+            "url": url,
+            "final_url": str(r.url),
+            "headers": [(k, v) for k, v in r.headers.multi_items() if k.lower() not in self.HOP_HEADERS],
+            "stored_at": time.time(),
+            "expires_at": expires_at,
+            "length": r.extensions.get("webappify_length"),
+        }
+        self.write(url, meta, r.content)
+        self.evict()
+
+    def revalidated(self, url: str, meta, body: bytes, r: httpx.Response):
+        # A 304 carries updated caching headers; merge them and restart the freshness clock
+        headers = dict((k.lower(), v) for k, v in meta["headers"])
+        for k, v in r.headers.multi_items():
+            if k.lower() not in self.HOP_HEADERS:
+                headers[k.lower()] = v
+        meta = {**meta, "headers": list(headers.items()), "stored_at": time.time()}
+        meta["expires_at"] = self.freshness(headers)
+        self.write(url, meta, body)
+        return meta
+
+    def write(self, url: str, meta, body: bytes):
+        data = json.dumps(meta).encode("utf-8") + b"\n" + body
+        atomic_write(self.path_for(url), data)
+        if self.size is not None:
+            self.size += len(data)
+
+    def response(self, meta, body: bytes, state: str) -> httpx.Response:
+        import httpx
+        request = httpx.Request("GET", meta["final_url"])
+        extensions = {"webappify_cache": state}
+        if meta.get("length") is not None:
+            extensions["webappify_length"] = meta["length"]
+        return httpx.Response(200, headers=meta["headers"], content=body, request=request, extensions=extensions)
+
+    def evict(self):
+        if self.size is not None and self.size <= self.max_bytes:
+            return
+        with (self.root / ".lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for path in self.root.glob("*.entry"):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            self.size = total
+            if total <= self.max_bytes:
+                return
+            # Least recently used first; trim to 90% so we don't evict on every store
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self.size = total
+
+# Set to None (--no-cache) to always go to the network
+HTTP_CACHE = HttpCache(CACHE_DIR / "http")
+MANIFEST_CACHE = CACHE_DIR / "manifests"
+
+class MemoryTracker:
+    # Peak memory per span for --memory-report. tracemalloc keeps a single peak counter,
+    # so it is read and reset at every span boundary and folded into each span open at
+    # the time; RSS is sampled from /proc by a background thread and folded in the same
+    # way. Spans overlap when work is concurrent, so each figure is the process-wide
+    # peak while the span ran, not just what the span itself allocated
+    def __init__(self, interval: float = 0.005):
+        import threading
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        tracemalloc.start()
+        self.lock = threading.Lock()
+        self.open = {}
+        self.traced_peak = 0
+        self.statm = pathlib.Path("/proc/self/statm")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        if self.statm.exists():
+            self.stopped = threading.Event()
+            threading.Thread(target=self.sample, args=(interval,), daemon=True).start()
+
+    def rss(self) -> int:
+        try:
+            return int(self.statm.read_text().split()[1]) * self.page_size
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def sample(self, interval: float):
+        while not self.stopped.wait(interval):
+            rss = self.rss()
+            with self.lock:
+                for st in self.open.values():
+                    st["rss"] = max(st["rss"], rss)
+
+    def fold(self):
+        # Caller holds the lock
+        _, peak = self.tracemalloc.get_traced_memory()
+        self.tracemalloc.reset_peak()
+        self.traced_peak = max(self.traced_peak, peak)
+        for st in self.open.values():
+            st["peak"] = max(st["peak"], peak)
+
+    def enter(self):
+        with self.lock:
+            self.fold()
+            current, _ = self.tracemalloc.get_traced_memory()
+            rss = self.rss()
+            st = {"start": current, "peak": current, "rss_start": rss, "rss": rss}
+            self.open[id(st)] = st
+            return st
+
+    def exit(self, st) -> dict:
+        with self.lock:
+            self.fold()
+            del self.open[id(st)]
+        return {"peak_kb": st["peak"] // 1024, "growth_kb": (st["peak"] - st["start"]) // 1024,
+                "rss_kb": st["rss"] // 1024, "rss_growth_kb": (st["rss"] - st["rss_start"]) // 1024}
+
+    def high_water_kb(self) -> int:
+        # The kernel's own peak RSS for the whole run (0 where /proc isn't available)
+        try:
+            with open("/proc/self/status") as f:
+                return next((int(line.split()[1]) for line in f if line.startswith("VmHWM:")), 0)
+        except OSError:
+            return 0
+
+class Timings:
+    # Wall-clock spans for --timings. Spans overlap (concurrent downloads) and arrive
+    # from worker threads, so each is simply appended with its offset from the start.
+    # With memory=True (--memory-report) each span also records peak memory
+    def __init__(self, memory: bool = False):
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.memory = MemoryTracker() if memory else None
+
+    def record(self, name: str, start: float, end: float, **attrs):
+        self.spans.append({"name": name, "start_ms": round((start - self.t0) * 1000, 3),
+                           "ms": round((end - start) * 1000, 3), **attrs})
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        # Yields the attrs dict so the body can add results (status, bytes, ...)
+        mem = self.memory.enter() if self.memory is not None else None
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            if mem is not None:
+                attrs.update(self.memory.exit(mem))
+            self.record(name, start, end, **attrs)
+
+    def totals(self):
+        # Per span name, in order of first appearance: count, summed and longest time
+        out = {}
+        for sp in self.spans:
+            t = out.setdefault(sp["name"], {"count": 0, "ms": 0.0, "max_ms": 0.0})
+            t["count"] += 1
+            t["ms"] = round(t["ms"] + sp["ms"], 3)
+            t["max_ms"] = max(t["max_ms"], sp["ms"])
+        return out
+
+    def report(self) -> str:
+        wall = (time.perf_counter() - self.t0) * 1000
+        lines = [f"{'phase':24}{'count':>7}{'total ms':>12}{'max ms':>10}"]
+        for name, t in self.totals().items():
+            lines.append(f"{name:24}{t['count']:>7}{t['ms']:>12.1f}{t['max_ms']:>10.1f}")
+        lines.append(f"{'wall':24}{'':>7}{wall:>12.1f}")
+        lines.append("Spans overlap when work runs concurrently, so totals can exceed wall time.")
+        return "\n".join(lines)
+
+    def memory_report(self) -> str:
+        # Per span name, the worst span: peak traced (Python) memory and peak RSS, each
+        # with how far it rose above where it stood when the span began. Pillow's pixel
+        # buffers aren't visible to tracemalloc, so image work shows up under RSS
+        worst = {}
+        for sp in self.spans:
+            if "peak_kb" not in sp:
+                continue
+            w = worst.setdefault(sp["name"], {"peak_kb": 0, "growth_kb": 0, "rss_kb": 0, "rss_growth_kb": 0})
+            for key in w:
+                w[key] = max(w[key], sp[key])
+        lines = [f"{'phase':24}{'traced KiB':>12}{'growth':>10}{'RSS KiB':>11}{'growth':>10}"]
+        for name, w in worst.items():
+            lines.append(f"{name:24}{w['peak_kb']:>12}{w['growth_kb']:>10}{w['rss_kb']:>11}{w['rss_growth_kb']:>10}")
+        with self.memory.lock:
+            self.memory.fold()
+        lines.append(f"{'run':24}{self.memory.traced_peak // 1024:>12}{'':>10}{self.memory.high_water_kb():>11}")
+        lines.append("Peaks are process-wide while the phase ran, so concurrent phases share them.")
+        return "\n".join(lines)
+
+    def as_json(self):
+        out = {"wall_ms": round((time.perf_counter() - self.t0) * 1000, 3),
+               "totals": self.totals(), "spans": self.spans}
+        if self.memory is not None:
+            out["memory"] = {"traced_peak_kb": self.memory.traced_peak // 1024,
+                             "rss_high_water_kb": self.memory.high_water_kb()}
+        return out
+
+# Set by --timings / --timings-json / --memory-report; while None, span() costs next to nothing
+TIMINGS = None
+# Set by --har
+HAR = None
+
+def span(name: str, **attrs):
+    # Untimed spans still hand out a dict to fill in; a fresh one each, since concurrent
+    # fetches and worker threads all write into theirs
+    return TIMINGS.span(name, **attrs) if TIMINGS is not None else contextlib.nullcontext({})
+
+class RequestTrace:
+    # httpcore trace hook for one fetch and the redirects it follows: for every request
+    # sent (a "hop"), when each phase (connect_tcp, start_tls, send_request_headers,
+    # receive_response_body, ...) started and completed, by time.perf_counter()
+    def __init__(self):
+        self.hops = []
+        # Converts perf_counter readings to wall-clock time
+        self.wall = time.time() - time.perf_counter()
+
+    async def __call__(self, event: str, info):
+        step, _, stage = event.rpartition(".")
+        if not self.hops or "response_closed.complete" in self.hops[-1]:
+            self.hops.append({})
+        self.hops[-1][f"{step.partition('.')[2]}.{stage}"] = time.perf_counter()
+
+    @staticmethod
+    def between(hop, start: str, end: str):
+        if start in hop and end in hop:
+            return hop[end] - hop[start]
+        return None
+
+    def record_spans(self, timings: Timings, url: str):
+        # connect covers DNS and TCP: httpcore doesn't report name resolution on its own
+        for hop in self.hops:
+            for name, start, end in (("connect", "connect_tcp.started", "connect_tcp.complete"),
+                                     ("tls", "start_tls.started", "start_tls.complete"),
+                                     ("ttfb", "send_request_headers.started", "receive_response_headers.complete")):
+                if start in hop and end in hop:
+                    timings.record(name, hop[start], hop[end], url=url)
+
+class HarLog:
+    # Every HTTP exchange of the run as HAR 1.2 entries (--har): one per request sent,
+    # so a redirect chain shows up hop by hop, plus cache hits that never hit the network
+    def __init__(self):
+        self.entries = []
+
+    @staticmethod
+    def iso(t: float) -> str:
+        import datetime
+        return datetime.datetime.fromtimestamp(t, datetime.timezone.utc).isoformat(timespec="milliseconds")
+
+    @staticmethod
+    def pairs(headers):
+        return [{"name": k, "value": v} for k, v in headers.multi_items()] if headers is not None else []
+
+    def request(self, method: str, url: str, version: str, headers):
+        from urllib.parse import parse_qsl
+        return {"method": method, "url": url, "httpVersion": version, "cookies": [],
+                "headers": self.pairs(headers),
+                "queryString": [{"name": k, "value": v} for k, v in parse_qsl(urlparse(url).query, keep_blank_values=True)],
+                "headersSize": -1, "bodySize": 0}
+
+    def add(self, url: str, started: float, trace: RequestTrace = None, response=None, content_size: int = 0,
+            body_size: int = -1, error: str = None, **extra):
+        # started: time.time() when the fetch began, for hops the trace knows nothing about
+        responses = [*response.history, response] if response is not None else [None]
+        hops = trace.hops if trace else []
+        between = RequestTrace.between
+        for i, r in enumerate(responses):
+            hop = hops[i] if i < len(hops) else {}
+            last = i == len(responses) - 1
+            version = r.http_version if r is not None else "HTTP/1.1"
+            connect = between(hop, "connect_tcp.started", "connect_tcp.complete")
+            ssl = between(hop, "start_tls.started", "start_tls.complete")
+            timings = {
+                "blocked": -1,
+                "dns": -1,
+                "connect": round(((connect or 0) + (ssl or 0)) * 1000, 3) if connect is not None else -1,
+                "ssl": round(ssl * 1000, 3) if ssl is not None else -1,
+                "send": round((between(hop, "send_request_headers.started", "send_request_body.complete") or 0) * 1000, 3),
+                "wait": round((between(hop, "send_request_body.complete", "receive_response_headers.complete") or 0) * 1000, 3),
+                "receive": round((between(hop, "receive_response_headers.complete", "response_closed.started") or 0) * 1000, 3),
+            }
+            entry = {
+                "startedDateTime": self.iso(min(hop.values()) + trace.wall if hop else started),
+                "time": round(sum(v for k, v in timings.items() if v > 0 and k != "ssl"), 3),
+                "request": self.request("GET", str(r.request.url) if r is not None else url, version,
+                                        r.request.headers if r is not None else None),
+                "response": {
+                    "status": r.status_code if r is not None else 0,
+                    "statusText": r.reason_phrase if r is not None else "",
+                    "httpVersion": version,
+                    "cookies": [],
+                    "headers": self.pairs(r.headers if r is not None else None),
+                    "content": {"size": content_size if last else 0,
+                                "mimeType": r.headers.get("content-type", "") if r is not None else ""},
+                    "redirectURL": r.headers.get("location", "") if r is not None and not last else "",
+                    "headersSize": -1,
+                    "bodySize": body_size if last else -1,
+                },
+                "cache": {},
+                "timings": timings,
+            }
+            if last:
+                if error:
+                    entry["_error"] = error
+                entry.update({f"_{k}": v for k, v in extra.items() if v is not None})
+            self.entries.append(entry)
+
+    def as_json(self):
+        return {"log": {"version": "1.2", "creator": {"name": "webappify", "version": "1.0"},
+                        "entries": sorted(self.entries, key=lambda e: e["startedDateTime"])}}
+
+def detached_response(r: httpx.Response, body: bytes, **extensions) -> httpx.Response:
+    # Freeze a partially read streaming response into a plain one holding `body`. Its
+    # Content-Length no longer describes the body, but callers sizing up the resource
+    # (say, the probe's byte cap) still need it, so it's kept as the webappify_length extension
+    import httpx
+    headers = [(k, v) for k, v in r.headers.multi_items() if k.lower() not in HttpCache.HOP_HEADERS]
+    length = r.headers.get("content-length", "")
+    if length.isdigit():
+        extensions["webappify_length"] = int(length)
+    return httpx.Response(r.status_code, headers=headers, content=body, request=r.request,
+                          history=r.history, extensions=extensions)
+
+def full_response(r: httpx.Response) -> httpx.Response:
+    # A range response that turned out to hold the whole resource, as the 200 it amounts to
+    import httpx
+    headers = [(k, v) for k, v in r.headers.multi_items() if k.lower() != "content-range"]
+    return httpx.Response(200, headers=headers, content=r.content, request=r.request, extensions=r.extensions)
+
+async def read_capped(r: httpx.Response, max_bytes: int = None, accept=None) -> bytes:
+    # Whole body, but give up as soon as it's known to exceed max_bytes, or as soon as
+    # accept(first SNIFF_BYTES) says the content is of no use to us
+    length = r.headers.get("content-length")
+    if max_bytes is not None and length and length.isdigit() and int(length) > max_bytes:
+        raise ValueError(f"{r.url}: {length} bytes exceeds the {max_bytes} byte limit")
+    buf = bytearray()
+    sniffed = accept is None
+    async for chunk in r.aiter_bytes():
+        buf += chunk
+        if not sniffed and len(buf) >= SNIFF_BYTES:
+            sniffed = True
+            if not accept(bytes(buf)):
+                raise ValueError(f"{r.url}: unusable content")
+        if max_bytes is not None and len(buf) > max_bytes:
+            raise ValueError(f"{r.url}: exceeds the {max_bytes} byte limit")
+    if not sniffed and not accept(bytes(buf)):
+        raise ValueError(f"{r.url}: unusable content")
+    return bytes(buf)
+
+async def fetch_async(url, client: httpx.AsyncClient, timeout=15, read_body=None, cache_key=None, headers=None,
+                      max_bytes=None, accept=None):
+    # read_body(response) -> bytes lets callers stop reading early; since the result
+    # isn't the full resource it must be cached under its own cache_key.
+    # max_bytes and accept reject (rather than truncate) a body without buffering all of it
+    with span("fetch", url=url) as sp:
+        key = cache_key or url
+        cache = HTTP_CACHE
+        entry = cache.load(key) if cache else None
+        headers = dict(headers or {})
+        started = time.time()
+        if entry:
+            meta, body = entry
+            if cache.is_fresh(meta):
+                sp["cache"] = "hit"
+                r = cache.response(meta, body, "hit")
+                if HAR is not None:
+                    HAR.add(url, started, response=r, content_size=len(body), body_size=0, fromCache="disk")
+                return r
+            headers.update(cache.validators(meta))
+        trace = RequestTrace() if TIMINGS is not None or HAR is not None else None
+        raw = content = error = None
+        try:
+            async with client.stream("GET", url, timeout=timeout, follow_redirects=True, headers=headers,
+                                     extensions={"trace": trace} if trace else None) as r:
+                raw = r
+                sp["status"] = r.status_code
+                if entry and r.status_code == 304:
+                    sp["cache"] = "revalidated"
+                    meta = cache.revalidated(key, meta, body, r)
+                    return cache.response(meta, body, "revalidated")
+                r.raise_for_status()
+                if read_body is None and (max_bytes is not None or accept is not None):
+                    r = detached_response(r, await read_capped(r, max_bytes, accept))
+                elif read_body is None:
+                    await r.aread()
+                else:
+                    r = detached_response(r, await read_body(r), webappify_partial=True)
+                content = r.content
+        except BaseException as e:
+            error = f"{type(e).__name__}: {str(e).splitlines()[0]}" if str(e) else type(e).__name__
+            raise
+        finally:
+            if trace is not None:
+                if TIMINGS is not None:
+                    trace.record_spans(TIMINGS, url)
+                if HAR is not None:
+                    HAR.add(url, started, trace, raw, content_size=len(content) if content is not None else 0,
+                            body_size=raw.num_bytes_downloaded if raw is not None else -1, error=error,
+                            partial=True if read_body is not None and content is not None else None)
+        sp["bytes"] = len(content)
+        if cache:
+            cache.store(key, r)
+        return r
+
+def read_prefix(n: int):
+    # read_body hook for fetch_async that stops after the first n bytes
+    async def read(r: httpx.Response) -> bytes:
+        buf = bytearray()
+        async for chunk in r.aiter_bytes():
+            buf += chunk
+            if len(buf) >= n:
+                break
+        return bytes(buf[:n])
+    return read
+
+def fetch(url, timeout=15):
+    return run_sync(fetch_async, url, timeout=timeout)
+
+def collect_icon_candidates(head: PageHead, final_url: str, manifest_icons=()):
     candidates = []
+    # Manifest icons come with exact sizes, so they lead
+    candidates.extend(manifest_icons)
+    rel_candidates = pick_best_icon_links(head, final_url)
+    og = find_og_image(head, final_url)
     candidates.extend(rel_candidates)
     if og:
         candidates.append(og)
@@ -86,49 +990,654 @@ def discover_icon_urls(page_url: str, session: requests.Session):
         if c not in seen:
             uniq.append(c)
             seen.add(c)
-    return uniq, soup.title.string.strip() if soup.title else None, final_url
+    return uniq
+
+def parse_icon_page(html: str, final_url: str, backend: str = "auto"):
+    head = extract_head(html, backend)
+    return collect_icon_candidates(head, final_url), head.title
+
+def find_manifest_url(head: PageHead, base_url: str):
+    for link in head.links:
+        if "manifest" in [r.lower() for r in link.get("rel", [])] and link.get("href"):
+            return urljoin(base_url, link["href"])
+    return None
+
+def parse_manifest_icons(manifest, base_url: str):
+    # Icon URLs from a Web App Manifest, purpose "any" before "maskable" (monochrome and
+    # other special-purpose icons are skipped), then by declared size, largest first
+    ranked = []
+    icons = manifest.get("icons") if isinstance(manifest, dict) else None
+    for icon in icons if isinstance(icons, list) else []:
+        if not isinstance(icon, dict) or not isinstance(icon.get("src"), str) or not icon["src"]:
+            continue
+        purposes = str(icon.get("purpose") or "any").lower().split()
+        if "any" in purposes:
+            purpose_rank = 0
+        elif "maskable" in purposes:
+            purpose_rank = 1
+        else:
+            continue
+        sizes = str(icon.get("sizes") or "").lower().split()
+        if "any" in sizes:
+            # Scalable, as good as it gets
+            size_val = 1 << 30
+        else:
+            try:
+                size_val = max(int(x.split("x")[0]) for x in sizes if "x" in x)
+            except ValueError:
+                size_val = 0
+        ranked.append((purpose_rank, -size_val, urljoin(base_url, icon["src"])))
+    ranked.sort(key=lambda x: x[:2])
+    return [u for _, _, u in ranked]
+
+def load_cached_manifest(manifest_url: str):
+    if MANIFEST_CACHE is None:
+        return None
+    path = MANIFEST_CACHE / f"{hashlib.sha256(manifest_url.encode('utf-8')).hexdigest()}.json"
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if entry.get("manifest_url") != manifest_url or time.time() - entry.get("fetched_at", 0) > MANIFEST_TTL:
+        return None
+    return entry["icons"]
+
+def store_cached_manifest(manifest_url: str, icons):
+    if MANIFEST_CACHE is None:
+        return
+    entry = {"manifest_url": manifest_url, "icons": icons, "fetched_at": time.time()}
+    path = MANIFEST_CACHE / f"{hashlib.sha256(manifest_url.encode('utf-8')).hexdigest()}.json"
+    atomic_write(path, json.dumps(entry).encode("utf-8"))
+
+async def fetch_manifest_icons_async(manifest_url: str, client: httpx.AsyncClient):
+    # Keyed by the manifest URL the page points at, so apps sharing an origin but not
+    # a manifest don't share icons, and redirected pages still find their entry
+    icons = load_cached_manifest(manifest_url)
+    if icons is None:
+        r = await fetch_async(manifest_url, client)
+        icons = parse_manifest_icons(json.loads(r.content), str(r.url))
+        store_cached_manifest(manifest_url, icons)
+    return icons
+
+class HeadScanner(HTMLParser):
+    # Incremental tokenizer that answers "has the <head> ended yet?", and reports a
+    # <link rel=manifest> the moment it streams past so the manifest can be fetched early
+    def __init__(self, on_manifest=None):
+        super().__init__(convert_charrefs=False)
+        self.done = False
+        self.on_manifest = on_manifest
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+        elif tag == "link" and self.on_manifest:
+            attrs = dict(attrs)
+            if "manifest" in (attrs.get("rel") or "").lower().split() and attrs.get("href"):
+                self.on_manifest(attrs["href"])
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+async def read_head(r: httpx.Response, max_bytes: int = HEAD_MAX_BYTES, on_manifest=None) -> bytes:
+    # Read just enough of the page to cover <head>, then let the connection go
+    scanner = HeadScanner(on_manifest and (lambda href: on_manifest(urljoin(str(r.url), href))))
+    try:
+        decoder = codecs.getincrementaldecoder(r.charset_encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buf = bytearray()
+    async for chunk in r.aiter_bytes():
+        buf += chunk
+        scanner.feed(decoder.decode(chunk))
+        if scanner.done or len(buf) >= max_bytes:
+            break
+    return bytes(buf[:max_bytes])
+
+async def discover_icon_urls_async(page_url: str, client: httpx.AsyncClient, head_only: bool = True, backend: str = "auto",
+                                   strict: bool = False):
+    with span("discover", url=page_url):
+        return await _discover_icon_urls_async(page_url, client, head_only, backend, strict)
+
+async def _discover_icon_urls_async(page_url: str, client: httpx.AsyncClient, head_only: bool, backend: str, strict: bool):
+    import asyncio
+    manifest_task = None
+
+    def start_manifest(manifest_url):
+        # Runs alongside the rest of the <head> download
+        nonlocal manifest_task
+        if manifest_task is None:
+            manifest_task = asyncio.ensure_future(fetch_manifest_icons_async(manifest_url, client))
+
+    try:
+        try:
+            if head_only:
+                r = await fetch_async(page_url, client, cache_key=f"head:{page_url}",
+                                      read_body=lambda r: read_head(r, on_manifest=start_manifest))
+            else:
+                r = await fetch_async(page_url, client)
+        except Exception:
+            if strict:
+                raise
+            # Later try /favicon.ico fallback
+            return [], None, page_url
+        final_url = str(r.url)
+        with span("parse_head", url=final_url, bytes=len(r.content)):
+            head = extract_head(r.text, backend)
+        manifest_url = find_manifest_url(head, final_url)
+        if manifest_url:
+            start_manifest(manifest_url)
+        manifest_icons = []
+        if manifest_task is not None:
+            try:
+                manifest_icons = await manifest_task
+            except Exception:
+                manifest_icons = []
+        return collect_icon_candidates(head, final_url, manifest_icons), head.title, final_url
+    finally:
+        if manifest_task is not None and not manifest_task.done():
+            manifest_task.cancel()
+
+def discover_icon_urls(page_url: str, head_only: bool = True, backend: str = "auto"):
+    return run_sync(discover_icon_urls_async, page_url, head_only=head_only, backend=backend)
 
 def ensure_dirs():
     APP_DIR.mkdir(parents=True, exist_ok=True)
     ICON_DIR.mkdir(parents=True, exist_ok=True)
     PROFILE_BASE.mkdir(parents=True, exist_ok=True)
+    (ICON_STORE / "memo").mkdir(parents=True, exist_ok=True)
+
+def pick_frame_size(sizes, target: int):
+    # The smallest frame that still covers target, else the largest there is
+    area = lambda s: s[0] * s[1]
+    big = [s for s in sizes if min(s[0], s[1]) >= target]
+    return min(big, key=area) if big else max(sizes, key=area)
+
+def select_frame(img, target: int):
+    # Multi-resolution containers (ICO, ICNS, multi-page TIFF): pick one frame from the
+    # directory and decode only that one, instead of Pillow's default frame
+    if img.format == "ICO":
+        return img.ico.getimage(pick_frame_size(img.ico.sizes(), target))
+    if img.format == "ICNS":
+        # Sizes are (w, h, scale); compare by the pixels they actually hold
+        sizes = [(w * scale, h * scale, (w, h, scale)) for w, h, scale in img.icns.itersizes()]
+        return img.icns.getimage(pick_frame_size(sizes, target)[2])
+    if img.format == "TIFF" and getattr(img, "n_frames", 1) > 1:
+        # Seeking only reads each page's header
+        frames = []
+        for i in range(img.n_frames):
+            img.seek(i)
+            frames.append((*img.size, i))
+        img.seek(pick_frame_size(frames, target)[2])
+    return img
+
+# (kind, ((offset, magic), ...)): every magic must match. Checked in order.
+IMAGE_SIGNATURES = (
+    ("png", ((0, b"\x89PNG\r\n\x1a\n"),)),
+    ("jpeg", ((0, b"\xff\xd8\xff"),)),
+    ("gif", ((0, b"GIF87a"),)),
+    ("gif", ((0, b"GIF89a"),)),
+    ("webp", ((0, b"RIFF"), (8, b"WEBP"))),
+    ("ico", ((0, b"\x00\x00\x01\x00"),)),
+    ("cur", ((0, b"\x00\x00\x02\x00"),)),
+    ("icns", ((0, b"icns"),)),
+    ("avif", ((4, b"ftypavif"),)),
+    ("avif", ((4, b"ftypavis"),)),
+    ("tiff", ((0, b"II*\x00"),)),
+    ("tiff", ((0, b"MM\x00*"),)),
+    ("bmp", ((0, b"BM"),)),
+)
+# What each kind is routed to; anything not listed is rejected
+IMAGE_HANDLERS = {
+    "svg": "svg",
+    "ico": "frames", "icns": "frames", "tiff": "frames",
+    "png": "raster", "jpeg": "raster", "gif": "raster", "webp": "raster",
+    "cur": "raster", "avif": "raster", "bmp": "raster",
+}
+# Enough of a stream to classify it
+SNIFF_BYTES = 512
+
+def sniff_image(data: bytes):
+    # Classify the first chunk of a download by its magic bytes; None for anything
+    # that isn't an image we can use (HTML error pages, JSON, empty bodies...)
+    for kind, magics in IMAGE_SIGNATURES:
+        if all(data[off:off + len(magic)] == magic for off, magic in magics):
+            return kind
+    # SVG is text: allow a BOM, whitespace, an XML prolog, comments and a doctype first
+    text = data[:SNIFF_BYTES].lstrip(b"\xef\xbb\xbf").lstrip().lower()
+    if text.startswith((b"<svg", b"<?xml", b"<!--", b"<!doctype svg")) and b"<svg" in text:
+        return "svg"
+    return None
+
+def image_handler(data: bytes):
+    return IMAGE_HANDLERS.get(sniff_image(data))
+
+def square_png(png: bytes, size: int) -> bytes:
+    # Renderers keep the SVG's aspect ratio; center a non-square result on a transparent square
+    info = probe_image_size(png)
+    if not info or (info[1], info[2]) == (size, size) or not PIL_OK:
+        return png
+    from io import BytesIO
+    from PIL import Image
+    img = Image.open(BytesIO(png)).convert("RGBA")
+    canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+    out = BytesIO()
+    canvas.save(out, format="PNG")
+    return out.getvalue()
+
+def rasterize_svg(content: bytes, size: int):
+    # PNG bytes for an SVG at size x size, via cairosvg or else rsvg-convert; None
+    # when neither is available or the SVG won't render
+    try:
+        import cairosvg
+    except (ImportError, OSError):
+        # cairosvg raises OSError when the cairo library itself is missing
+        cairosvg = None
+    if cairosvg is not None:
+        try:
+            return square_png(cairosvg.svg2png(bytestring=content, output_width=size, output_height=size), size)
+        except Exception:
+            return None
+    tool = shutil.which("rsvg-convert")
+    if tool is None:
+        return None
+    proc = subprocess.run([tool, "--width", str(size), "--height", str(size), "--keep-aspect-ratio", "--format", "png"],
+                          input=content, capture_output=True, check=False)
+    if proc.returncode != 0 or not proc.stdout:
+        return None
+    return square_png(proc.stdout, size)
 
-def save_icon_from_url(url: str, dest_stem: pathlib.Path, session: requests.Session, size_px: int = 256):
-    r = fetch(url, session)
-    content = r.content
-    # Guess image type
-    kind = imghdr.what(None, h=content)
-    # Allow SVG by sniffing
-    if not kind and (content.strip().startswith(b"<svg") or b"<svg" in content[:200].lower()):
-        svg_path = dest_stem.with_suffix(".svg")
-        svg_path.write_bytes(content)
-        return svg_path
+def render_icons(content: bytes, sizes):
+    # Decode once and produce a square PNG for every size. Returns (ext, {size: data});
+    # SVG that can't be rasterized and images Pillow can't read come back unchanged,
+    # once, under the key None. Bytes that aren't an image at all raise ValueError
+    kind = sniff_image(content)
+    handler = IMAGE_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError("not a recognized image format")
+    if handler == "svg":
+        # Vector: render every size straight from the source
+        out = {}
+        for size in sizes:
+            with span("rasterize", size=size):
+                png = rasterize_svg(content, size)
+            if png is None:
+                return ".svg", {None: content}
+            out[size] = png
+        return ".png", out
+    # Fallback: keep raw bytes and hope DE can read them
+    raw_ext = f".{kind}"
     # For other types, try Pillow to normalize to PNG
     if not PIL_OK:
-        # Fallback: write raw and hope DE can read it
-        ext = f".{kind}" if kind else ".ico"
-        raw_path = dest_stem.with_suffix(ext)
-        raw_path.write_bytes(content)
-        return raw_path
+        return raw_ext, {None: content}
     from io import BytesIO
+    from PIL import Image
+    target = max(sizes)
     try:
-        img = Image.open(BytesIO(content)).convert("RGBA")
+        with span("decode", kind=kind, bytes=len(content)):
+            img = Image.open(BytesIO(content))
+            if handler == "frames":
+                img = select_frame(img, target)
+            too_big = img.width * img.height > MAX_IMAGE_PIXELS
+            if not too_big:
+                # Let the JPEG decoder scale down by up to 8x while it decodes, so memory
+                # follows the target size rather than the source (a 6000x4000 hero photo
+                # would be ~96 MB as RGBA)
+                img.draft("RGB", (target, target))
+                img.load()
+                if img.mode not in ("RGB", "RGBA", "L", "LA"):
+                    img = img.convert("RGBA")
+    except Image.DecompressionBombError as e:
+        # Past Pillow's own limit it refuses at open; that's our limit too, not an unreadable image
+        raise ValueError(str(e)) from e
     except Exception:
         # As last resort, just write bytes
-        ext = f".{kind}" if kind else ".ico"
-        raw_path = dest_stem.with_suffix(ext)
-        raw_path.write_bytes(content)
-        return raw_path
-    # Center-crop to square then resize
-    w, h = img.size
-    side = min(w, h)
-    left = (w - side) // 2
-    top = (h - side) // 2
-    img = img.crop((left, top, left + side, top + side))
-    img = img.resize((size_px, size_px), Image.LANCZOS)
-    out = dest_stem.with_suffix(".png")
-    img.save(out, format="PNG")
-    return out
+        return raw_ext, {None: content}
+    if too_big:
+        raise ValueError(f"{img.width}x{img.height} image exceeds {MAX_IMAGE_PIXELS} pixels")
+    # Center-crop to square, shrink by whole factors, and only then expand to RGBA
+    with span("resize", size=target):
+        w, h = img.size
+        side = min(w, h)
+        left = (w - side) // 2
+        top = (h - side) // 2
+        img = img.crop((left, top, left + side, top + side))
+        if side >= 2 * target:
+            img = img.reduce(side // target)
+        img = img.convert("RGBA")
+    out = {}
+    # Largest first, halving the working copy (cheap box filter) while it's still at
+    # least twice the next size, so LANCZOS never works from the full-size source
+    for size in sorted(sizes, reverse=True):
+        with span("resize", size=size):
+            while img.width >= 2 * size:
+                img = img.reduce(2)
+            icon = img.resize((size, size), Image.LANCZOS)
+        with span("encode", size=size):
+            buf = BytesIO()
+            icon.save(buf, format="PNG")
+        out[size] = buf.getvalue()
+    return ".png", out
+
+def render_icon(content: bytes, size_px: int = 256):
+    # Normalize downloaded bytes to (data, ext): SVG passes through, rasters become square PNGs
+    ext, out = render_icons(content, [size_px])
+    return out.get(size_px, out.get(None)), ext
+
+def store_icon(data: bytes, ext: str) -> pathlib.Path:
+    # Content-addressed: identical icons are stored exactly once
+    stored = ICON_STORE / f"{hashlib.sha256(data).hexdigest()}{ext}"
+    if not stored.exists():
+        atomic_write(stored, data)
+    return stored
+
+def link_icon(stored: pathlib.Path, dest: pathlib.Path) -> pathlib.Path:
+    # Point dest at the stored icon: hardlink, or symlink across filesystems, or copy
+    if dest.exists() and (os.path.samefile(stored, dest) or same_bytes(dest, stored.read_bytes())):
+        return dest
+    txn = STAGING.get()
+    tmp = txn.stage(dest) if txn else dest.with_name(f".{dest.name}.{os.urandom(4).hex()}.tmp")
+    try:
+        os.link(stored, tmp)
+    except OSError:
+        try:
+            os.symlink(stored, tmp)
+        except OSError:
+            shutil.copyfile(stored, tmp)
+    if not txn:
+        os.replace(tmp, dest)
+    return dest
+
+def theme_icon_path(name: str, size, ext: str):
+    # Where a hicolor theme expects an app icon of this size and format
+    if ext == ".svg":
+        return HICOLOR_DIR / "scalable" / "apps" / f"{name}.svg"
+    if ext == ".png" and size in HICOLOR_SIZES:
+        return HICOLOR_DIR / f"{size}x{size}" / "apps" / f"{name}.png"
+    return None
+
+def write_icons(content: bytes, dest_stem: pathlib.Path, size_px: int = 256, theme_name: str = None):
+    # Install the icon at dest_stem and, with theme_name, as a full hicolor size set.
+    # Returns (icon path, [themed paths]); themed is empty for formats a theme can't hold.
+    # The memo maps (source hash, size) to the stored output, so sizes we've rendered
+    # before are linked into place without being decoded or resized again
+    with span("write_icons", bytes=len(content)):
+        return _write_icons(content, dest_stem, size_px, theme_name)
+
+def _write_icons(content: bytes, dest_stem: pathlib.Path, size_px: int, theme_name: str):
+    src = hashlib.sha256(content).hexdigest()
+    sizes = {size_px} | (set(HICOLOR_SIZES) if theme_name else set())
+    stored = {}
+    for size in sizes:
+        try:
+            path = ICON_STORE / (ICON_STORE / "memo" / f"{src}-{size}").read_text(encoding="utf-8").strip()
+        except OSError:
+            continue
+        if path.is_file():
+            stored[size] = path
+    missing = sizes - stored.keys()
+    if missing:
+        ext, rendered = render_icons(content, missing)
+        for size in missing:
+            stored[size] = store_icon(rendered.get(size, rendered.get(None)), ext)
+            atomic_write(ICON_STORE / "memo" / f"{src}-{size}", stored[size].name.encode("utf-8"))
+    icon_path = link_icon(stored[size_px], dest_stem.with_suffix(stored[size_px].suffix))
+    themed = []
+    if theme_name:
+        for size in sorted(HICOLOR_SIZES):
+            dest = theme_icon_path(theme_name, size, stored[size].suffix)
+            if dest is None:
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if dest not in themed:
+                themed.append(link_icon(stored[size], dest))
+        # Rasterized SVGs still ship the scalable original for DEs that prefer it
+        if themed and stored[size_px].suffix == ".png" and sniff_image(content) == "svg":
+            dest = theme_icon_path(theme_name, None, ".svg")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            themed.append(link_icon(store_icon(content, ".svg"), dest))
+    return icon_path, themed
+
+def write_icon(content: bytes, dest_stem: pathlib.Path, size_px: int = 256):
+    return write_icons(content, dest_stem, size_px)[0]
+
+def update_icon_cache():
+    # Run once after all icons are in place, not per icon
+    tool = shutil.which("gtk-update-icon-cache")
+    if tool and HICOLOR_DIR.is_dir():
+        with span("gtk-update-icon-cache"):
+            subprocess.run([tool, "--force", "--ignore-theme-index", "--quiet", str(HICOLOR_DIR)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+def update_desktop_database():
+    # Refresh the MIME cache for our launchers; like the icon cache, once per run
+    tool = shutil.which("update-desktop-database")
+    if tool and APP_DIR.is_dir():
+        with span("update-desktop-database"):
+            subprocess.run([tool, "--quiet", str(APP_DIR)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+async def save_icon_from_url_async(url: str, dest_stem: pathlib.Path, client: httpx.AsyncClient, size_px: int = 256):
+    import asyncio
+    r = await fetch_async(url, client, max_bytes=ICON_MAX_BYTES, accept=image_handler)
+    # Decoding and resizing is CPU work; keep it off the event loop
+    return await asyncio.to_thread(write_icon, r.content, dest_stem, size_px)
+
+def save_icon_from_url(url: str, dest_stem: pathlib.Path, size_px: int = 256):
+    return run_sync(save_icon_from_url_async, url, dest_stem, size_px=size_px)
+
+async def race_icon_candidates(candidates, client: httpx.AsyncClient, width: int = 4, prefetched=None,
+                               max_bytes: int = ICON_MAX_BYTES):
+    # Download up to `width` candidates at once, in preference order. The best-ranked
+    # success wins: anything ranked below it is cancelled as soon as it lands, and we
+    # only wait for candidates ranked above it. Returns (url, response) or None.
+    import asyncio
+    prefetched = prefetched or {}
+
+    async def download(url):
+        with span("candidate", url=url) as sp:
+            if url in prefetched:
+                sp["prefetched"] = True
+                return prefetched[url]
+            return await fetch_async(url, client, max_bytes=max_bytes, accept=image_handler)
+
+    pending = {}
+    best = None
+    responses = {}
+    next_rank = 0
+    try:
+        while True:
+            while len(pending) < max(1, width) and next_rank < len(candidates) and best is None:
+                pending[next_rank] = asyncio.ensure_future(download(candidates[next_rank]))
+                next_rank += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending.values(), return_when=asyncio.FIRST_COMPLETED)
+            for rank in [r for r, t in pending.items() if t in done]:
+                task = pending.pop(rank)
+                if task.exception() is None and (best is None or rank < best):
+                    best = rank
+                    responses[rank] = task.result()
+            if best is not None:
+                for rank in [r for r in pending if r > best]:
+                    pending.pop(rank).cancel()
+                if not pending:
+                    break
+    finally:
+        for task in pending.values():
+            task.cancel()
+        await asyncio.gather(*pending.values(), return_exceptions=True)
+    if best is None:
+        return None
+    return candidates[best], responses[best]
+
+def _u16be(b, i): return int.from_bytes(b[i:i + 2], "big")
+def _u16le(b, i): return int.from_bytes(b[i:i + 2], "little")
+def _u24le(b, i): return int.from_bytes(b[i:i + 3], "little")
+def _u32be(b, i): return int.from_bytes(b[i:i + 4], "big")
+def _u32le(b, i): return int.from_bytes(b[i:i + 4], "little")
+
+def _jpeg_size(data: bytes):
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before the real marker
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            return _u16be(data, i + 7), _u16be(data, i + 5)
+        i += 2 + _u16be(data, i + 2)
+    return None
+
+def _svg_size(data: bytes):
+    text = data[:4096].decode("utf-8", errors="replace")
+    m = re.search(r"<svg\b[^>]*>", text, re.I | re.S)
+    if not m:
+        return None
+    tag = m.group(0)
+    vb = re.search(r"viewBox\s*=\s*[\"']\s*[-\d.eE]+[\s,]+[-\d.eE]+[\s,]+([\d.eE]+)[\s,]+([\d.eE]+)", tag)
+    if vb:
+        return round(float(vb.group(1))), round(float(vb.group(2)))
+    w = re.search(r"\bwidth\s*=\s*[\"']\s*([\d.]+)(px)?\s*[\"']", tag)
+    h = re.search(r"\bheight\s*=\s*[\"']\s*([\d.]+)(px)?\s*[\"']", tag)
+    if w and h:
+        return round(float(w.group(1))), round(float(h.group(1)))
+    return 0, 0
+
+def _png_size(data):
+    return (_u32be(data, 16), _u32be(data, 20)) if len(data) >= 24 else None
+
+def _ico_size(data):
+    count = _u16le(data, 4)
+    sizes = [(data[6 + 16 * i] or 256, data[7 + 16 * i] or 256)
+             for i in range(count) if 6 + 16 * i + 16 <= len(data)]
+    return max(sizes) if sizes else None
+
+def _gif_size(data):
+    return (_u16le(data, 6), _u16le(data, 8)) if len(data) >= 10 else None
+
+def _webp_size(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        return _u16le(data, 26) & 0x3FFF, _u16le(data, 28) & 0x3FFF
+    if chunk == b"VP8L":
+        bits = _u32le(data, 21)
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return _u24le(data, 24) + 1, _u24le(data, 27) + 1
+    return None
+
+def _bmp_size(data):
+    return (_u32le(data, 18), abs(int.from_bytes(data[22:26], "little", signed=True))) if len(data) >= 26 else None
+
+IMAGE_SIZE_PARSERS = {
+    "png": _png_size,
+    "ico": _ico_size,
+    "cur": _ico_size,
+    "jpeg": _jpeg_size,
+    "gif": _gif_size,
+    "webp": _webp_size,
+    "bmp": _bmp_size,
+    "svg": lambda data: _svg_size(data) or (0, 0),
+}
+
+def probe_image_size(data: bytes):
+    # (kind, width, height) from the first few KB of an image, without decoding it;
+    # width/height are None when the header is cut short or we can't read that format's
+    kind = sniff_image(data)
+    if kind is None:
+        return None
+    parser = IMAGE_SIZE_PARSERS.get(kind)
+    return (kind, *((parser and parser(data)) or (None, None)))
+
+async def probe_icon_candidate(url: str, client: httpx.AsyncClient, probe_bytes: int = PROBE_BYTES,
+                               max_bytes: int = ICON_MAX_BYTES):
+    # Fetch just the head of a candidate. Returns (info, response) where info is
+    # probe_image_size() of it (None if it isn't an image we know, or is too big to
+    # download or decode), and response is only kept if the probe read the whole file
+    with span("probe", url=url):
+        r = await fetch_async(url, client, read_body=read_prefix(probe_bytes), cache_key=f"probe:{url}",
+                              headers={"Range": f"bytes=0-{probe_bytes - 1}"})
+    info = probe_image_size(r.content)
+    total = r.headers.get("content-range", "").rpartition("/")[2]
+    if r.status_code == 200:
+        # The server ignored Range and offered the whole file; its size is the original Content-Length
+        total = str(r.extensions.get("webappify_length", ""))
+    if total.isdigit() and int(total) > max_bytes:
+        return None, None
+    if info and info[1] and info[2] and info[1] * info[2] > MAX_IMAGE_PIXELS:
+        return None, None
+    complete = len(r.content) < probe_bytes and (r.status_code == 200 or total == str(len(r.content)))
+    return info, (r if complete else None)
+
+def rank_probed_icons(probed, size_px: int):
+    # probed: [(url, info)] in preference order. Scalable or big-enough icons come first,
+    # then smaller ones largest first, then images whose size we couldn't read (or
+    # that didn't answer the probe in time); JPEGs (no alpha, usually photos) lose
+    # ties. Non-images are dropped.
+    def key(item):
+        rank, (_, (kind, w, h)) = item
+        photo = kind == "jpeg"
+        if kind == "svg":
+            return (0, photo, 0, rank)
+        if w is None or h is None:
+            return (2, photo, 0, rank)
+        side = min(w, h)
+        if side >= size_px:
+            return (0, photo, 0, rank)
+        return (1, photo, -side, rank)
+    usable = [(rank, item) for rank, item in enumerate(probed) if item[1] is not None]
+    return [url for _, (url, _) in sorted(usable, key=key)]
+
+async def probe_and_rank_icons(candidates, client: httpx.AsyncClient, size_px: int, width: int = 4,
+                               max_bytes: int = ICON_MAX_BYTES):
+    # Returns (ranked urls, {url: full response} for candidates the probe read entirely)
+    import asyncio
+    limit = asyncio.Semaphore(max(1, width))
+
+    async def probe(url):
+        async with limit:
+            try:
+                return url, *await probe_icon_candidate(url, client, max_bytes=max_bytes)
+            except Exception:
+                return url, None, None
+
+    def settled():
+        # True once a candidate has probed as good as any can be (scalable or big enough,
+        # not a photo) and everything ahead of it in page order has answered
+        for task in tasks:
+            if not task.done():
+                return False
+            _, info, _ = task.result()
+            if info and info[0] != "jpeg" and (info[0] == "svg" or (info[1] and info[2] and min(info[1], info[2]) >= size_px)):
+                return True
+        return False
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PROBE_DEADLINE
+    tasks = [asyncio.ensure_future(probe(url)) for url in candidates]
+    pending = set(tasks)
+    while pending and not settled() and loop.time() < deadline:
+        _, pending = await asyncio.wait(pending, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+    results = []
+    for url, task in zip(candidates, tasks):
+        if task.done():
+            results.append(task.result())
+        else:
+            task.cancel()
+            results.append((url, (None, None, None), None))
+    ranked = rank_probed_icons([(url, info) for url, info, _ in results], size_px)
+    prefetched = {url: r for url, _, r in results if r is not None}
+    return ranked, prefetched
 
 def write_desktop_file(path: pathlib.Path, name: str, exec_cmd: str, icon_path: pathlib.Path, categories: str):
     contents = f"""[Desktop Entry]
@@ -142,7 +1651,10 @@ Terminal=false
 Categories={categories}
 StartupNotify=true
 """
-    path.write_text(contents, encoding="utf-8")
+    with span("desktop_file") as sp:
+        written = install_file(path, contents.encode("utf-8"))
+        sp["written"] = written
+    return written
 
 def build_exec(browser_cmd: str, url: str, wm_class: str = None, profile_dir: pathlib.Path = None, wayland: bool = True):
     parts = [browser_cmd, f"--new-window", f"--app={url}"]
@@ -155,28 +1667,324 @@ def build_exec(browser_cmd: str, url: str, wm_class: str = None, profile_dir: pa
         parts.append(f"--user-data-dir={str(profile_dir)}")
     return " ".join(parts)
 
-def main():
-    parser = argparse.ArgumentParser(description="Create a .desktop webapp and fetch its icon.")
+REGISTRY_COLUMNS = ("app_id", "slug", "name", "url", "final_url", "desktop_path", "icon_path", "icon_hash",
+                    "icon_url", "icon_source_hash", "page_hash", "icon_name", "profile_dir", "browser", "options",
+                    "created_at", "updated_at")
+
+def open_registry():
+    # WAL lets readers (list/show) run while batch workers or other processes write;
+    # busy_timeout makes concurrent writers queue instead of failing
+    import sqlite3
+    REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(REGISTRY_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=30000")
+    db.execute("""CREATE TABLE IF NOT EXISTS webapps (
+        app_id TEXT PRIMARY KEY,
+        slug TEXT NOT NULL,
+        name TEXT NOT NULL,
+        url TEXT NOT NULL,
+        final_url TEXT,
+        desktop_path TEXT NOT NULL,
+        icon_path TEXT,
+        icon_hash TEXT,
+        icon_url TEXT,
+        icon_source_hash TEXT,
+        page_hash TEXT,
+        icon_name TEXT,
+        profile_dir TEXT,
+        browser TEXT,
+        options TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""")
+    db.execute("CREATE INDEX IF NOT EXISTS webapps_slug ON webapps (slug)")
+    # Registries written before refresh existed lack the hashes it compares against
+    columns = {row["name"] for row in db.execute("PRAGMA table_info(webapps)")}
+    for column in ("icon_source_hash", "page_hash"):
+        if column not in columns:
+            db.execute(f"ALTER TABLE webapps ADD COLUMN {column} TEXT")
+    return db
+
+def record_webapp(app_id: str, slug: str, name: str, url: str, final_url: str, desktop_path: pathlib.Path,
+                  icon_path: pathlib.Path, icon_url: str, icon_name: str, profile_dir: pathlib.Path,
+                  browser: str, options: dict, icon_source_hash: str = None, page_hash: str = None):
+    icon_hash = None
+    if icon_path and icon_path.is_file():
+        icon_hash = hashlib.sha256(icon_path.read_bytes()).hexdigest()
+    now = time.time()
+    db = open_registry()
+    try:
+        with db:
+            db.execute(
+                """INSERT INTO webapps (app_id, slug, name, url, final_url, desktop_path, icon_path, icon_hash,
+                                        icon_url, icon_source_hash, page_hash, icon_name, profile_dir, browser, options,
+                                        created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (app_id) DO UPDATE SET
+                       slug = excluded.slug, name = excluded.name, url = excluded.url,
+                       final_url = excluded.final_url, desktop_path = excluded.desktop_path,
+                       icon_path = excluded.icon_path, icon_hash = excluded.icon_hash,
+                       icon_url = excluded.icon_url, icon_source_hash = excluded.icon_source_hash,
+                       page_hash = excluded.page_hash, icon_name = excluded.icon_name,
+                       profile_dir = excluded.profile_dir, browser = excluded.browser,
+                       options = excluded.options, updated_at = excluded.updated_at""",
+                (app_id, slug, name, url, final_url, str(desktop_path), str(icon_path) if icon_path else None,
+                 icon_hash, icon_url, icon_source_hash, page_hash, icon_name, str(profile_dir) if profile_dir else None, browser,
+                 json.dumps(options), now, now),
+            )
+    finally:
+        db.close()
+
+def find_webapps(db, keys):
+    # Look apps up by app id (desktop file name) or slug
+    rows = []
+    for key in keys:
+        found = db.execute("SELECT * FROM webapps WHERE app_id = ? OR slug = ? ORDER BY app_id", (key, key)).fetchall()
+        if not found:
+            raise KeyError(key)
+        rows.extend(found)
+    return rows
+
+def cmd_list(argv) -> int:
+    parser = argparse.ArgumentParser(prog="webappify.py list", description="List installed webapps.")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args(argv)
+    db = open_registry()
+    try:
+        rows = db.execute("SELECT app_id, name, url FROM webapps ORDER BY app_id").fetchall()
+    finally:
+        db.close()
+    if args.json:
+        print(json.dumps([dict(row) for row in rows], indent=2))
+        return 0
+    width = max((len(row["app_id"]) for row in rows), default=0)
+    for row in rows:
+        print(f"{row['app_id']:{width}}  {row['name']}  <{row['url']}>")
+    return 0
+
+def cmd_show(argv) -> int:
+    parser = argparse.ArgumentParser(prog="webappify.py show", description="Show what webappify installed for an app.")
+    parser.add_argument("apps", nargs="+", metavar="APP", help="App id (desktop file name) or slug")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args(argv)
+    db = open_registry()
+    try:
+        rows = find_webapps(db, args.apps)
+    except KeyError as e:
+        print(f"{e.args[0]}: no such webapp", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    if args.json:
+        print(json.dumps([{**dict(row), "options": json.loads(row["options"] or "{}")} for row in rows], indent=2))
+        return 0
+    for i, row in enumerate(rows):
+        if i:
+            print()
+        for col in REGISTRY_COLUMNS:
+            value = row[col]
+            if col in ("created_at", "updated_at"):
+                value = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+            print(f"{col + ':':18}{value if value is not None else '-'}")
+    return 0
+
+def cmd_remove(argv) -> int:
+    parser = argparse.ArgumentParser(prog="webappify.py remove", description="Uninstall webapps.")
+    parser.add_argument("apps", nargs="+", metavar="APP", help="App id (desktop file name) or slug")
+    parser.add_argument("--purge-profile", action="store_true", help="Also delete the app's browser profile dir")
+    args = parser.parse_args(argv)
+    db = open_registry()
+    removed = themed = False
+    try:
+        rows = find_webapps(db, args.apps)
+        for row in rows:
+            paths = [pathlib.Path(row["desktop_path"])]
+            if row["icon_path"]:
+                paths.append(pathlib.Path(row["icon_path"]))
+            if row["icon_name"]:
+                paths.extend(HICOLOR_DIR.glob(f"*/apps/{row['icon_name']}.*"))
+            for path in paths:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                removed = True
+                themed = themed or HICOLOR_DIR in path.parents
+            if args.purge_profile and row["profile_dir"]:
+                shutil.rmtree(row["profile_dir"], ignore_errors=True)
+            with db:
+                db.execute("DELETE FROM webapps WHERE app_id = ?", (row["app_id"],))
+            print(f"Removed:   {row['desktop_path']}")
+    except KeyError as e:
+        print(f"{e.args[0]}: no such webapp", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    # Like install: the desktop's caches only need rebuilding if files actually went away
+    if removed:
+        update_desktop_database()
+        if themed:
+            update_icon_cache()
+    return 0
+
+def discovery_hash(candidates, title: str, final_url: str) -> str:
+    # What an app was built from, as far as the page goes. Refresh compares this rather
+    # than the page bytes, so markup churn that doesn't move the title or icons is ignored
+    return hashlib.sha256(json.dumps([title, final_url, candidates]).encode("utf-8")).hexdigest()
+
+async def revalidate_async(url: str, client: httpx.AsyncClient, known_hash: str = None, **fetch_kwargs) -> bool:
+    # Conditional GET through the HTTP cache; True if the bytes differ from known_hash
+    # (or, for apps recorded before that was kept, from what the cache had). A fresh
+    # cache hit or a 304 only saves moving the body
+    old_hash = known_hash
+    if old_hash is None and HTTP_CACHE:
+        entry = HTTP_CACHE.load(fetch_kwargs.get("cache_key") or url)
+        old_hash = hashlib.sha256(entry[1]).hexdigest() if entry else None
+    r = await fetch_async(url, client, **fetch_kwargs)
+    return hashlib.sha256(r.content).hexdigest() != old_hash
+
+async def refresh_webapp_async(row, client: httpx.AsyncClient, txn: Transaction):
+    # Returns the list of things that changed (empty if the app is up to date). Both checks
+    # compare against hashes in the registry, which only moves once a rebuild has landed,
+    # so a failed rebuild is retried next time
+    options = json.loads(row["options"] or "{}")
+    opts = argparse.Namespace(**options)
+    changed = []
+    candidates, title, final_url = await discover_icon_urls_async(row["url"], client, backend=opts.parser, strict=True)
+    if discovery_hash(candidates, title, final_url) != row["page_hash"]:
+        changed.append("page")
+    if row["icon_url"] and await revalidate_async(row["icon_url"], client, known_hash=row["icon_source_hash"],
+                                                  max_bytes=opts.max_icon_bytes, accept=image_handler):
+        changed.append("icon")
+    if not changed:
+        return changed
+    # Rebuild in place: same launcher file and profile even if the site's title changed.
+    # These overrides are refresh's own; the registry keeps the options the app was made with
+    opts.filename = row["app_id"]
+    opts.profile_dir = row["profile_dir"]
+    opts.force = True
+    _, icon_path, _ = await create_webapp_async(opts, client, recorded_options=options)
+    txn.commit()
+    old_icon = pathlib.Path(row["icon_path"]) if row["icon_path"] else None
+    if old_icon and old_icon != icon_path:
+        try:
+            old_icon.unlink()
+        except FileNotFoundError:
+            pass
+    return changed
+
+async def refresh_async(args) -> int:
+    import asyncio
+    db = open_registry()
+    try:
+        rows = find_webapps(db, args.apps) if args.apps else db.execute("SELECT * FROM webapps ORDER BY app_id").fetchall()
+    finally:
+        db.close()
+    limit = asyncio.Semaphore(max(1, args.jobs))
+    host_limits = {}
+
+    async def worker(row, client, staging_root):
+        # Each app is rebuilt in its own transaction, committed as soon as it's done
+        txn = Transaction(staging_root)
+        STAGING.set(txn)
+        host = urlparse(row["url"]).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(max(1, args.per_host)))
+        async with limit, host_limit:
+            try:
+                return row, txn, await refresh_webapp_async(row, client, txn), None
+            except Exception as e:
+                return row, txn, None, e
+
+    updated, unchanged, failed = 0, 0, 0
+    moved = themed = False
+    with staging_area() as staging_root:
+        async with make_client(max_connections=args.jobs * 2) as client:
+            for fut in asyncio.as_completed([worker(row, client, staging_root) for row in rows]):
+                row, txn, changed, exc = await fut
+                moved = moved or bool(txn.moves)
+                themed = themed or txn.touches(HICOLOR_DIR)
+                if exc is not None:
+                    failed += 1
+                    print(f"Failed:    {row['app_id']} ({exc})", file=sys.stderr)
+                elif changed:
+                    updated += 1
+                    print(f"Updated:   {row['app_id']} ({', '.join(changed)} changed)")
+                else:
+                    unchanged += 1
+    # A rebuild that rewrote nothing (say, only the candidate order moved) leaves the caches alone
+    if moved:
+        update_desktop_database()
+        if themed:
+            update_icon_cache()
+    print(f"\nRefresh: {updated} updated, {unchanged} unchanged, {failed} failed")
+    return 1 if failed else 0
+
+def cmd_refresh(argv) -> int:
+    import asyncio
+    parser = argparse.ArgumentParser(prog="webappify.py refresh",
+                                     description="Re-check installed webapps and rebuild the ones whose page or icon changed.")
+    parser.add_argument("apps", nargs="*", metavar="APP", help="App ids or slugs (default: all)")
+    parser.add_argument("--jobs", type=int, default=8, help="Apps checked concurrently (default 8)")
+    parser.add_argument("--per-host", type=int, default=2, help="Concurrent apps per host (default 2)")
+    args = parser.parse_args(argv)
+    ensure_dirs()
+    try:
+        return asyncio.run(refresh_async(args))
+    except KeyError as e:
+        print(f"{e.args[0]}: no such webapp", file=sys.stderr)
+        return 1
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Create a .desktop webapp and fetch its icon.",
+        epilog="Other commands: list, show APP, remove APP, refresh [APP], serve (see webappify.py COMMAND --help).",
+    )
     parser.add_argument("--name", required=False, help="App display name; defaults to page title or domain")
-    parser.add_argument("--url", required=True, help="Website URL")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Website URL")
+    target.add_argument("--batch", metavar="FILE", help="Create every webapp listed in a TOML/JSON/CSV manifest")
+    parser.add_argument("--jobs", type=int, default=8, help="Concurrent workers in --batch mode (default 8)")
     parser.add_argument("--browser", default=os.environ.get("WEBAPP_BROWSER", "chromium"), help="Browser command (default: chromium)")
     parser.add_argument("--class", dest="wm_class", default=None, help="WM_CLASS to set for the window")
     parser.add_argument("--isolated", action="store_true", help="Use per-app profile dir (~/.cache/ChromiumWebApps/<slug>)")
     parser.add_argument("--profile-dir", default=None, help="Explicit profile dir for --user-data-dir")
     parser.add_argument("--icon-size", type=int, default=256, help="Icon size in px (default 256)")
+    parser.add_argument("--race", type=int, default=4, help="Icon candidates to download in parallel (default 4)")
+    parser.add_argument("--max-icon-bytes", type=int, default=ICON_MAX_BYTES,
+                        help=f"Skip icon candidates larger than this (default {ICON_MAX_BYTES})")
+    parser.add_argument("--no-probe", action="store_true", help="Don't rank icon candidates by probing their real size first")
+    parser.add_argument("--no-icon-theme", action="store_true", help="Only install the single --icon-size icon, not a hicolor size set")
     parser.add_argument("--categories", default="Network;", help="Desktop menu categories (default Network;)")
     parser.add_argument("--filename", default=None, help="Override desktop file name (without extension)")
     parser.add_argument("--no-wayland", action="store_true", help="Do not add Wayland flag")
     parser.add_argument("--force", action="store_true", help="Overwrite existing files")
-    args = parser.parse_args()
+    parser.add_argument("--parser", choices=["auto", *HEAD_EXTRACTORS], default="auto",
+                        help="HTML backend for icon discovery (default: lxml if installed, else htmlparser)")
+    parser.add_argument("--no-cache", action="store_true", help=f"Bypass the HTTP cache in {CACHE_DIR}")
+    parser.add_argument("--timings", action="store_true", help="Print how long each phase took (to stderr)")
+    parser.add_argument("--timings-json", metavar="FILE", help="Write every timed span as JSON to FILE ('-' for stdout)")
+    parser.add_argument("--no-daemon", action="store_true", help="Don't forward to a running `webappify.py serve`; work in-process")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Print peak memory (tracemalloc and RSS) per phase; slows the run down")
+    parser.add_argument("--har", metavar="FILE", help="Record every HTTP request and response of the run to a HAR 1.2 file")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="DIR", help="Save every HTTP response into a cassette directory (implies --no-cache)")
+    cassette.add_argument("--replay", metavar="DIR",
+                          help="Serve HTTP from a recorded cassette via a local stand-in server; no network (implies --no-cache)")
+    parser.add_argument("--replay-latency", type=float, default=0, metavar="MS", help="Delay every replayed response by MS milliseconds")
+    parser.add_argument("--replay-bandwidth", type=float, default=None, metavar="KBPS",
+                        help="Pace replayed bodies to KBPS kilobytes per second")
+    return parser
 
-    ensure_dirs()
-
-    session = requests.Session()
-    icon_candidates, page_title, final_url = discover_icon_urls(args.url, session)
+async def create_webapp_async(opts, client: httpx.AsyncClient, recorded_options: dict = None):
+    import asyncio
+    icon_candidates, page_title, final_url = await discover_icon_urls_async(opts.url, client, backend=opts.parser)
+    page_hash = discovery_hash(icon_candidates, page_title, final_url)
 
     # Decide display name
-    disp_name = args.name
+    disp_name = opts.name
     if not disp_name:
         if page_title:
             disp_name = page_title
@@ -184,18 +1992,34 @@ def main():
             disp_name = urlparse(final_url).netloc
 
     slug = slugify(disp_name if disp_name else "webapp")
-    desktop_basename = args.filename or f"webapp-{slug}"
+    desktop_basename = opts.filename or f"webapp-{slug}"
     desktop_path = APP_DIR / f"{desktop_basename}.desktop"
 
     # Icon
     icon_stem = ICON_DIR / slug
     icon_path = None
-    for cand in icon_candidates:
+    prefetched = {}
+    if not opts.no_probe:
+        ranked, prefetched = await probe_and_rank_icons(icon_candidates, client, opts.icon_size, width=opts.race,
+                                                        max_bytes=opts.max_icon_bytes)
+        # If nothing probed as an image, fall back to trying everything in page order
+        icon_candidates = ranked or icon_candidates
+    won = await race_icon_candidates(icon_candidates, client, width=opts.race, prefetched=prefetched,
+                                     max_bytes=opts.max_icon_bytes)
+    themed = []
+    icon_url = icon_source_hash = None
+    if won is not None:
+        icon_url, r = won
+        icon_source_hash = hashlib.sha256(r.content).hexdigest()
+        if HTTP_CACHE and icon_url in prefetched:
+            # The probe read the whole icon but cached it under its probe key; file it
+            # under the plain URL too, which is what refresh revalidates
+            HTTP_CACHE.store(icon_url, full_response(r))
+        theme_name = None if opts.no_icon_theme else desktop_basename
         try:
-            icon_path = save_icon_from_url(cand, icon_stem, session, size_px=args.icon_size)
-            break
-        except Exception:
-            continue
+            icon_path, themed = await asyncio.to_thread(write_icons, r.content, icon_stem, opts.icon_size, theme_name)
+        except ValueError as e:
+            print(f"Icon skipped: {e}", file=sys.stderr)
     if icon_path is None:
         # last fallback: copy nothing, use generic
         # but DEs accept absolute icon paths; keep None -> skip writing
@@ -203,39 +2027,419 @@ def main():
 
     # Profile dir
     profile_dir = None
-    if args.profile_dir:
-        profile_dir = pathlib.Path(args.profile_dir).expanduser()
-    elif args.isolated:
+    if opts.profile_dir:
+        profile_dir = pathlib.Path(opts.profile_dir).expanduser()
+    elif opts.isolated:
         profile_dir = PROFILE_BASE / slug
 
     # WM_CLASS default to slug capitalized if not provided
-    wm_class = args.wm_class or re.sub(r"[^A-Za-z0-9]", "", slug.title())
+    wm_class = opts.wm_class or re.sub(r"[^A-Za-z0-9]", "", slug.title())
 
     exec_cmd = build_exec(
-        browser_cmd=args.browser,
+        browser_cmd=opts.browser,
         url=final_url,
         wm_class=wm_class,
         profile_dir=profile_dir,
-        wayland=not args.no_wayland
+        wayland=not opts.no_wayland
     )
 
-    if desktop_path.exists() and not args.force:
-        print(f"{desktop_path} already exists; use --force to overwrite", file=sys.stderr)
-        sys.exit(1)
+    if desktop_path.exists() and not opts.force:
+        raise FileExistsError(f"{desktop_path} already exists; use --force to overwrite")
 
     write_desktop_file(
         path=desktop_path,
         name=disp_name,
         exec_cmd=exec_cmd,
-        icon_path=icon_path if icon_path else pathlib.Path("/usr/share/pixmaps/gnome-globe.png"),
-        categories=args.categories,
+        # A themed icon is referenced by name so the DE can pick the right size
+        icon_path=desktop_basename if themed else icon_path if icon_path else pathlib.Path("/usr/share/pixmaps/gnome-globe.png"),
+        categories=opts.categories,
     )
+    record = functools.partial(
+        record_webapp,
+        app_id=desktop_basename,
+        slug=slug,
+        name=disp_name,
+        url=opts.url,
+        final_url=final_url,
+        desktop_path=desktop_path,
+        icon_path=icon_path,
+        icon_url=icon_url,
+        icon_source_hash=icon_source_hash,
+        icon_name=desktop_basename if themed else None,
+        profile_dir=profile_dir,
+        browser=opts.browser,
+        page_hash=page_hash,
+        options=recorded_options if recorded_options is not None else {k: getattr(opts, k, None) for k in sorted(BATCH_FIELDS)},
+    )
+    # Inside a transaction the registry only hears about the app once its files are in place
+    txn = STAGING.get()
+    if txn:
+        txn.defer(record)
+    else:
+        record()
+    return desktop_path, icon_path, profile_dir
+
+def create_webapp(opts):
+    return run_sync(create_webapp_async, opts)
+
+BATCH_BOOL_FIELDS = {"isolated", "no_wayland", "force", "no_probe", "no_icon_theme"}
+BATCH_INT_FIELDS = {"icon_size", "race", "max_icon_bytes"}
+BATCH_PER_APP_FIELDS = {"name", "url", "wm_class", "profile_dir", "filename"}
+BATCH_FIELDS = {"name", "url", "browser", "wm_class", "profile_dir", "categories", "filename", "parser"} | BATCH_BOOL_FIELDS | BATCH_INT_FIELDS
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in {"1", "true", "yes", "on", "y"}
+
+def normalize_batch_row(row: dict, lineno: int) -> dict:
+    # Row keys mirror the CLI options: "icon-size", "icon_size" and "class" are all accepted
+    opts = {}
+    for key, value in row.items():
+        if key is None:
+            raise ValueError(f"entry {lineno}: too many columns")
+        field = key.strip().lower().replace("-", "_")
+        if field == "class":
+            field = "wm_class"
+        if field not in BATCH_FIELDS:
+            raise ValueError(f"entry {lineno}: unknown option {key!r}")
+        if value is None or value == "":
+            continue
+        if field in BATCH_BOOL_FIELDS:
+            value = _parse_bool(value)
+        elif field in BATCH_INT_FIELDS:
+            value = int(value)
+        opts[field] = value
+    if not opts.get("url"):
+        raise ValueError(f"entry {lineno}: missing url")
+    return opts
+
+def load_batch(path: pathlib.Path):
+    suffix = path.suffix.lower()
+    if suffix == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("TOML batches need Python 3.11+ or the tomli package (pip install tomli)") from None
+        with path.open("rb") as f:
+            data = tomllib.load(f)
+        rows = data.get("app", data.get("apps", []))
+    elif suffix == ".json":
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+        rows = data.get("apps", []) if isinstance(data, dict) else data
+    elif suffix == ".csv":
+        with path.open(newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"unsupported batch file type {suffix!r} (use .toml, .json or .csv)")
+    return [normalize_batch_row(row, i) for i, row in enumerate(rows, 1)]
 
-    print(f"Installed: {desktop_path}")
+async def run_batch_async(args) -> int:
+    import asyncio
+    try:
+        entries = load_batch(pathlib.Path(args.batch).expanduser())
+    except (OSError, ValueError) as e:
+        # Unreadable file, unknown format, bad syntax or a bad entry: nothing to install
+        print(f"{args.batch}: {e}", file=sys.stderr)
+        return 1
+    # Shared CLI options act as defaults for every entry; per-app ones never do
+    defaults = {k: v for k, v in vars(args).items() if k in BATCH_FIELDS}
+    defaults.update({k: None for k in BATCH_PER_APP_FIELDS})
+    jobs = max(1, args.jobs)
+    limit = asyncio.Semaphore(jobs)
+
+    async def worker(opts, client):
+        # Each worker runs in its own task, so this transaction is private to the entry
+        txn = Transaction(staging_root)
+        STAGING.set(txn)
+        async with limit:
+            try:
+                return opts, txn, await create_webapp_async(opts, client), None
+            except Exception as e:
+                return opts, txn, None, e
+
+    installed, skipped, failed = [], [], []
+    staged = []
+    started = time.monotonic()
+    with staging_area() as staging_root:
+        async with make_client(max_connections=jobs * 2) as client:
+            workers = [worker(argparse.Namespace(**{**defaults, **entry}), client) for entry in entries]
+            for fut in asyncio.as_completed(workers):
+                opts, txn, result, exc = await fut
+                # Nothing is on disk yet, so the existence check can't see earlier entries
+                if exc is None and not opts.force and result[0] in installed:
+                    exc = FileExistsError(f"{result[0]} is also written by another entry; use --force to overwrite")
+                if isinstance(exc, FileExistsError):
+                    skipped.append((opts.url, str(exc)))
+                    print(f"Skipped:   {opts.url} ({exc})", file=sys.stderr)
+                elif exc is not None:
+                    failed.append((opts.url, str(exc)))
+                    print(f"Failed:    {opts.url} ({exc})", file=sys.stderr)
+                else:
+                    desktop_path, _, _ = result
+                    installed.append(desktop_path)
+                    staged.append(txn)
+                    print(f"Staged:    {desktop_path}")
+        for txn in staged:
+            txn.commit()
+    # Re-running a batch that changes nothing leaves the desktop's caches alone
+    if any(txn.moves for txn in staged):
+        update_desktop_database()
+        # Entries may set no-icon-theme for themselves, so go by what actually landed
+        if any(txn.touches(HICOLOR_DIR) for txn in staged):
+            update_icon_cache()
+    elapsed = time.monotonic() - started
+
+    print(f"\nBatch: {len(installed)} installed, {len(skipped)} skipped, {len(failed)} failed "
+          f"({len(entries)} entries, {jobs} workers, {elapsed:.1f}s)")
+    for url, err in failed:
+        print(f"  failed: {url}: {err}")
+    return 1 if failed else 0
+
+# Options the daemon can't honour per request; runs that use them stay in-process
+LOCAL_ONLY_FIELDS = ("batch", "no_cache", "timings", "timings_json", "memory_report", "har", "record", "replay")
+
+async def serve_async(args) -> int:
+    import asyncio
+    import signal
+    # Pay for the heavy imports once, up front, instead of on the first request
+    import httpx  # noqa: F401
+    if PIL_OK:
+        from PIL import Image  # noqa: F401
+    if LXML_OK:
+        import lxml.html  # noqa: F401
+    socket_path = pathlib.Path(args.socket).expanduser()
+    if forward_request(socket_path, {"op": "ping"}, timeout=1) is not None:
+        print(f"Already running on {socket_path}", file=sys.stderr)
+        return 1
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        socket_path.unlink()
+    except FileNotFoundError:
+        pass
+
+    limit = asyncio.Semaphore(max(1, args.jobs))
+    host_limits = {}
+    cache_lock = asyncio.Lock()
+    changes = refreshed = 0
+
+    async def update_caches():
+        # Bursts of requests share one run of the desktop cache tools: a run that
+        # starts after our commit already covers it
+        nonlocal changes, refreshed
+        changes += 1
+        mine = changes
+        async with cache_lock:
+            if refreshed >= mine:
+                return
+            refreshed = changes
+            await asyncio.to_thread(update_desktop_database)
+            await asyncio.to_thread(update_icon_cache)
+
+    async def run(request, client):
+        # A forwarded command line, parsed here so that the client needn't load anything.
+        # --help and usage errors come back as text; anything the daemon can't do per
+        # request is handed back to the client to run in-process
+        out, err = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                # The client's WEBAPP_BROWSER, not ours; an explicit --browser later in argv still wins
+                opts = build_parser().parse_args(["--browser", request.get("browser") or "chromium", *request["argv"]])
+            except SystemExit as e:
+                return {"status": e.code or 0, "stdout": out.getvalue(), "stderr": err.getvalue()}
+        # A client with another HOME (say, a sandboxed test run) expects its files there, not in ours
+        if opts.no_daemon or request.get("home") != str(HOME) or any(getattr(opts, k) for k in LOCAL_ONLY_FIELDS):
+            return {"local": True}
+        if opts.profile_dir:
+            opts.profile_dir = os.path.join(request.get("cwd", ""), os.path.expanduser(opts.profile_dir))
+        host = urlparse(opts.url).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(max(1, args.per_host)))
+        async with limit, host_limit:
+            with staging_area() as staging_root:
+                # Each connection is handled in its own task, so the transaction is per request
+                txn = Transaction(staging_root)
+                STAGING.set(txn)
+                desktop_path, icon_path, profile_dir = await create_webapp_async(opts, client)
+                txn.commit()
+        if txn.moves:
+            await update_caches()
+        return {"status": 0, "stdout": install_summary(desktop_path, icon_path, profile_dir), "stderr": ""}
+
+    async with make_client(max_connections=args.jobs * 2) as client:
+        async def handle(reader, writer):
+            try:
+                request = json.loads(await reader.readline())
+                if request.get("op") == "ping":
+                    reply = {"status": 0}
+                elif request.get("op") == "run":
+                    reply = await run(request, client)
+                else:
+                    reply = {"status": 2, "error": f"unknown request {request.get('op')!r}"}
+            except FileExistsError as e:
+                reply = {"status": 1, "stdout": "", "stderr": f"{e}\n"}
+            except Exception as e:
+                reply = {"status": 1, "stdout": "", "stderr": f"{type(e).__name__}: {e}\n"}
+            try:
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+                writer.close()
+            except OSError:
+                pass
+
+        # Owner-only socket: requests write into this user's home
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(handle, path=str(socket_path))
+        finally:
+            os.umask(umask)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        print(f"Listening on {socket_path}")
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            try:
+                socket_path.unlink()
+            except FileNotFoundError:
+                pass
+    return 0
+
+def cmd_serve(argv) -> int:
+    import asyncio
+    parser = argparse.ArgumentParser(prog="webappify.py serve",
+                                     description="Keep webappify resident and create launchers for CLI calls forwarded over a Unix socket.")
+    parser.add_argument("--socket", default=str(SOCKET_PATH), help=f"Socket path (default {SOCKET_PATH})")
+    parser.add_argument("--jobs", type=int, default=8, help="Requests processed concurrently (default 8)")
+    parser.add_argument("--per-host", type=int, default=2, help="Concurrent requests per site (default 2)")
+    args = parser.parse_args(argv)
+    ensure_dirs()
+    return asyncio.run(serve_async(args))
+
+def forward_request(socket_path: pathlib.Path, request, timeout: float = FORWARD_TIMEOUT):
+    # Send one request to a running daemon; None if nothing is listening there, or if
+    # it doesn't answer in time or goes away before replying
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(socket_path))
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return json.loads(b"".join(chunks))
+        except (OSError, ValueError):
+            return None
+
+def forward_to_daemon(args, argv):
+    # Thin client: hand the command line to `webappify.py serve` if one is running.
+    # Returns the exit status, or None to run in-process
+    if args.no_daemon or any(getattr(args, k) for k in LOCAL_ONLY_FIELDS) or not SOCKET_PATH.exists():
+        return None
+    reply = forward_request(SOCKET_PATH, {"op": "run", "argv": argv, "cwd": os.getcwd(), "home": str(HOME),
+                                          "browser": os.environ.get("WEBAPP_BROWSER")})
+    if reply is None or reply.get("local"):
+        return None
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["status"]
+
+def install_summary(desktop_path, icon_path, profile_dir) -> str:
+    lines = [f"Installed: {desktop_path}"]
     if icon_path:
-        print(f"Icon:      {icon_path}")
+        lines.append(f"Icon:      {icon_path}")
     if profile_dir:
-        print(f"Profile:   {profile_dir}")
+        lines.append(f"Profile:   {profile_dir}")
+    return "\n".join(lines) + "\n"
+
+COMMANDS = {
+    "list": cmd_list,
+    "show": cmd_show,
+    "remove": cmd_remove,
+    "refresh": cmd_refresh,
+    "serve": cmd_serve,
+}
+
+def report_timings(args):
+    if args.timings:
+        print(TIMINGS.report(), file=sys.stderr)
+    if args.memory_report:
+        print(TIMINGS.memory_report(), file=sys.stderr)
+    if args.timings_json == "-":
+        print(json.dumps(TIMINGS.as_json(), indent=2))
+    elif args.timings_json:
+        atomic_write(pathlib.Path(args.timings_json).expanduser(), json.dumps(TIMINGS.as_json(), indent=2).encode("utf-8"))
+
+def main():
+    global HTTP_CACHE, MANIFEST_CACHE, TIMINGS, HAR, CASSETTE
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+    args = build_parser().parse_args()
+    status = forward_to_daemon(args, sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    if args.no_cache or args.record or args.replay:
+        # A recording must see every response, and a replay must serve every one, so
+        # nothing may come from (or pollute) the cache
+        HTTP_CACHE = None
+        MANIFEST_CACHE = None
+    if args.record:
+        CASSETTE = Recorder(pathlib.Path(args.record).expanduser())
+    elif args.replay:
+        bandwidth = args.replay_bandwidth * 1024 if args.replay_bandwidth else None
+        CASSETTE = ReplayServer(pathlib.Path(args.replay).expanduser(), args.replay_latency / 1000, bandwidth).start()
+    if args.timings or args.timings_json or args.memory_report:
+        TIMINGS = Timings(memory=args.memory_report)
+    if args.har:
+        HAR = HarLog()
+    # With --timings-json -, stdout is the JSON alone; progress and the summary go to stderr
+    summary_to = contextlib.redirect_stdout(sys.stderr) if args.timings_json == "-" else contextlib.nullcontext()
+    try:
+        with summary_to:
+            install(args)
+    finally:
+        if TIMINGS is not None:
+            report_timings(args)
+        if HAR is not None:
+            atomic_write(pathlib.Path(args.har).expanduser(), json.dumps(HAR.as_json(), indent=2).encode("utf-8"))
+
+def install(args):
+    ensure_dirs()
+
+    if args.batch:
+        import asyncio
+        sys.exit(asyncio.run(run_batch_async(args)))
+
+    with staging_area() as staging_root:
+        txn = Transaction(staging_root)
+        STAGING.set(txn)
+        try:
+            desktop_path, icon_path, profile_dir = create_webapp(args)
+        except FileExistsError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        txn.commit()
+    if txn.moves:
+        update_desktop_database()
+        if txn.touches(HICOLOR_DIR):
+            update_icon_cache()
+
+    sys.stdout.write(install_summary(desktop_path, icon_path, profile_dir))
 
 if __name__ == "__main__":
     main()